@@ -168,11 +168,6 @@ def merge_clusters(
 
                 self_intersecting = self_intersecting or not is_valid
 
-        if i == 7 or i == 18:
-            import pdb
-
-            pdb.set_trace()
-
         # check if there is any self-intersection/penetration of walls/free space, which should not occur
         if not self_intersecting:
             print("Accepted and greedy merge completed.")
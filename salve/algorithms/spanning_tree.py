@@ -15,6 +15,7 @@ import scipy
 import salve.utils.rotation_utils as rotation_utils
 import salve.utils.graph_rendering_utils as graph_rendering_utils
 import salve.common.edge_classification as edge_classification
+from salve.algorithms.rotation_averaging import globalaveraging2d
 from salve.common.edge_classification import EdgeClassification
 from salve.common.posegraph2d import PoseGraph2d, ENDCOLOR, REDTEXT
 from salve.common.sim2 import Sim2
@@ -33,7 +34,7 @@ def greedily_construct_st(i2Ri1_dict: Dict[Tuple[int, int], np.ndarray]) -> List
     """
     edges = i2Ri1_dict.keys()
 
-    num_nodes = max([max(i1, i2) for i1, i2 in edges]) + 1
+    num_nodes = int(np.asarray(list(edges)).max()) + 1
 
     # Find the largest connected component
     cc_nodes = graph_utils.get_nodes_in_largest_connected_component(edges)
@@ -42,31 +43,68 @@ def greedily_construct_st(i2Ri1_dict: Dict[Tuple[int, int], np.ndarray]) -> List
     wRi_list = [None] * num_nodes
     # Choose origin node
     origin_node = cc_nodes[0]
-    wRi_list[origin_node] = np.eye(2)
 
     G = nx.Graph()
     G.add_edges_from(edges)
 
-    # Ignore 0th node, as we already set its global pose as the origin
-    for dst_node in cc_nodes[1:]:
+    # 2d rotations compose by adding their angles, so the tree is walked with scalar angles, and rotation matrices
+    # are only constructed at the end. Edges may be traversed in either direction, so store the relative angle
+    # for both orderings of each edge.
+    i1_theta_i2_dict = {}
+    for (i1, i2), i2Ri1 in i2Ri1_dict.items():
+        i2_theta_i1 = math.atan2(i2Ri1[1, 0], i2Ri1[0, 0])
+        i1_theta_i2_dict[(i1, i2)] = -i2_theta_i1  # use inverse
+        i1_theta_i2_dict[(i2, i1)] = i2_theta_i1
+
+    # Walk a breadth-first search tree rooted at the origin, so that each node is reached via a shortest path from the
+    # origin, and chain the relative angle onto the already computed global angle of its parent `i1`.
+    w_theta_i_dict = {origin_node: 0.0}
+    for i2, i1 in nx.bfs_predecessors(G, source=origin_node):
+        # wRi = wR0 * 0R1
+        w_theta_i_dict[i2] = w_theta_i_dict[i1] + i1_theta_i2_dict[(i1, i2)]
+
+    w_theta_i = np.array(list(w_theta_i_dict.values()))
+    cos_theta = np.cos(w_theta_i)
+    sin_theta = np.sin(w_theta_i)
+    wRi_arr = np.stack([np.stack([cos_theta, -sin_theta], axis=1), np.stack([sin_theta, cos_theta], axis=1)], axis=1)
+    for i, wRi in zip(w_theta_i_dict.keys(), wRi_arr):
+        wRi_list[i] = wRi
 
-        # Determine the path to this node from the origin. ordered from [origin_node,...,dst_node]
-        path = nx.shortest_path(G, source=origin_node, target=dst_node)
+    return wRi_list
 
-        wRi = np.eye(2)
-        for (i1, i2) in zip(path[:-1], path[1:]):
 
-            # i1, i2 may not be in sorted order here. May need to reverse ordering
-            if i1 < i2:
-                i1Ri2 = i2Ri1_dict[(i1, i2)].T  # use inverse
-            else:
-                i1Ri2 = i2Ri1_dict[(i2, i1)]
+def estimate_global_rotations(
+    i2Ri1_dict: Dict[Tuple[int, int], np.ndarray], use_rotation_averaging: bool = False
+) -> List[Optional[np.ndarray]]:
+    """Estimate global 2d rotations for the largest connected component of a graph of Rot(2) measurements.
 
-            # wRi = wR0 * 0R1
-            wRi = wRi @ i1Ri2
+    The greedy spanning tree is cheap, and suited for a quick initialization, but it accumulates drift along each
+    path from the origin, and ignores all measurements outside of the tree. Rotation averaging (Shonan) instead
+    solves for all rotations jointly, using every measurement, at a higher cost.
 
-        wRi_list[dst_node] = wRi
+    Args:
+        i2Ri1_dict: mapping from pano ID pair (i1,i2) to relative rotation i2Ri1.
+        use_rotation_averaging: whether to use rotation averaging, instead of a greedy spanning tree.
 
+    Returns:
+        wRi_list: global 2d rotations, with the rotation of the smallest pano ID in the largest connected component
+            set to the identity. Entries are None for panos outside of the largest connected component.
+    """
+    if not use_rotation_averaging:
+        return greedily_construct_st(i2Ri1_dict)
+
+    num_nodes = int(np.asarray(list(i2Ri1_dict.keys())).max()) + 1
+    # Rotation averaging requires a single connected component.
+    cc_nodes = set(graph_utils.get_nodes_in_largest_connected_component(i2Ri1_dict.keys()))
+    i2Ri1_dict_cc = {(i1, i2): i2Ri1 for (i1, i2), i2Ri1 in i2Ri1_dict.items() if i1 in cc_nodes}
+    wRi_list_cc = globalaveraging2d(i2Ri1_dict_cc)
+
+    # Fix the gauge freedom in the same way as the greedy spanning tree, by placing the origin node at the identity.
+    origin_node = min(cc_nodes)
+    oRw = wRi_list_cc[origin_node].T
+    wRi_list = [None] * num_nodes
+    for i in cc_nodes:
+        wRi_list[i] = oRw @ wRi_list_cc[i]
     return wRi_list
 
 
@@ -77,9 +115,9 @@ def greedily_construct_st_Sim2(
 
     Find the largest connected component, then sort the nodes in the largest CC by their pano ID.
     Choose the smallest pano ID in that CC as the origin. Then, walk through the rest of the nodes
-    in the CC one at a time, and for each next node, find the shortest path to it through the graph.
-    Walk along each edge in that path, and chain the relative pose to the previous absolute (global) pose,
-    to get a new absolute (global) pose. Cache away this new global pose in a dictionary of Sim(2) objects.
+    in the CC in breadth-first order, so that each node is reached via a shortest path through the graph.
+    Chain the relative pose along the edge to each node, to the absolute (global) pose of its parent in
+    the path, to get a new absolute (global) pose. Cache away this new global pose in a list of Sim(2) objects.
 
     Intuition: shortest path is a way to try to minimize drift.
 
@@ -101,7 +139,7 @@ def greedily_construct_st_Sim2(
     if len(edges) == 0:
         return None
 
-    num_nodes = max([max(i1, i2) for i1, i2 in edges]) + 1
+    num_nodes = int(np.asarray(list(edges)).max()) + 1
 
     # Find the largest connected component.
     cc_nodes = graph_utils.get_nodes_in_largest_connected_component(edges)
@@ -115,28 +153,24 @@ def greedily_construct_st_Sim2(
     G = nx.Graph()
     G.add_edges_from(edges)
 
-    # Ignore 0th node, as we already set its global pose as the origin.
-    for dst_node in cc_nodes[1:]:
+    # Edges may be traversed in either direction, so store the relative pose for both orderings of each edge.
+    i1Si2_dict = {}
+    for (i1, i2), i2Si1 in i2Si1_dict.items():
+        i1Si2_dict[(i1, i2)] = i2Si1.inverse()  # use inverse
+        i1Si2_dict[(i2, i1)] = i2Si1
 
-        # Determine the path to this node from the origin. ordered from [origin_node,...,dst_node]
-        path = nx.shortest_path(G, source=origin_node, target=dst_node)
+    # Walk a breadth-first search tree rooted at the origin, so that each node is reached via a shortest path from the
+    # origin, and chain the relative pose onto the already computed global pose of its parent `i1`.
+    path_by_node = {origin_node: [origin_node]}
+    for i2, i1 in nx.bfs_predecessors(G, source=origin_node):
 
         if verbose:
-            print(f"\tPath from {origin_node}->{dst_node}: {str(path)}")
-
-        wSi = Sim2(R=np.eye(2), t=np.zeros(2), s=1.0)
-        for (i1, i2) in zip(path[:-1], path[1:]):
-
-            # i1, i2 may not be in sorted order here. May need to reverse ordering
-            if i1 < i2:
-                i1Si2 = i2Si1_dict[(i1, i2)].inverse()  # use inverse
-            else:
-                i1Si2 = i2Si1_dict[(i2, i1)]
+            # Path to this node from the origin, ordered from [origin_node,...,dst_node].
+            path_by_node[i2] = path_by_node[i1] + [i2]
+            print(f"\tPath from {origin_node}->{i2}: {str(path_by_node[i2])}")
 
-            # wRi = wR0 * 0R1
-            wSi = wSi.compose(i1Si2)
-
-        wSi_list[dst_node] = wSi
+        # wRi = wR0 * 0R1
+        wSi_list[i2] = wSi_list[i1].compose(i1Si2_dict[(i1, i2)])
 
     return wSi_list
 
@@ -266,7 +300,8 @@ def ransac_spanning_trees(
         wSi_list = greedily_construct_st_Sim2(i2Si1_dict, verbose=False)
 
         if wSi_list is None:
-            import pdb; pdb.set_trace()
+            # Degenerate hypothesis (no edges), so skip it.
+            continue
 
         avg_rot_error, med_rot_error, avg_trans_error, med_trans_error = compute_hypothesis_errors(
             measurements=measurements, wSi_list=wSi_list
@@ -269,10 +269,6 @@ def analyze_algorithm_results(raw_dataset_dir: str, json_results_dir: str) -> No
 
         num_ccs_per_floor.append(len(all_cc_data))
 
-        if num_ccs_per_floor == 0:
-            import pdb
-            pdb.set_trace()
-
         # Loop through the connected components. CC's are sorted by cardinality.
         for cc_idx, cc_info in enumerate(all_cc_data):
 
@@ -304,9 +300,7 @@ def analyze_algorithm_results(raw_dataset_dir: str, json_results_dir: str) -> No
         num_dropped_cameras = num_panos - num_reconst_cameras_on_floor
         num_dropped_cameras_per_floor.append(num_dropped_cameras)
         if num_panos == 0:
-            import pdb
-
-            pdb.set_trace()
+            raise RuntimeError(f"No panoramas found for Building {building_id}, {floor_id}.")
 
         # What % is found in the union?
         percent_reconstructed = num_reconst_cameras_on_floor / num_panos * 100
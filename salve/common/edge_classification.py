@@ -1,10 +1,14 @@
 """Data structure representing a CNN-classification result on a relative pose hypothesis (from a W/D/O alignment)."""
 
+import functools
 import glob
+import os
+import re
+import sys
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 import tqdm
@@ -16,6 +20,15 @@ from salve.common.posegraph2d import PoseGraph2d
 from salve.common.sim2 import Sim2
 from salve.common.two_view_estimation_report import TwoViewEstimationReport
 
+# Maximum number of threads used to read and parse serialized prediction batches.
+MAX_JSON_LOADING_THREADS = 8
+
+# Stem of a serialized prediction's image file, such as
+# `pair_3905___door_3_0_identity_floor_rgb_floor_01_partial_room_02_pano_38`.
+_PRED_FPATH_STEM_PATTERN = re.compile(
+    r"[^_]*_(?P<pair_idx>[^_]*).*?___(?P<wdo_pair_uuid>.*?)_(?P<configuration>identity|rotated)"
+    r"(?:_.*?)?(?P<floor_id>floor_0.*?)_partial.*_(?P<pano_id>\d+)"
+)
 
 @dataclass(frozen=False)
 class EdgeClassification:
@@ -27,14 +40,30 @@ class EdgeClassification:
         prob: probability of ...
         y_hat: predicted category.
         y_true: true category.
-        pair_idx: TODO
-        wdo_pair_uuid: TODO
+        pair_idx: index of the alignment hypothesis pair.
+        wdo_pair_uuid: ID of the W/D/O pair used for the alignment hypothesis, e.g. `door_3_0`.
         configuration: surface normal configuration (identity or rotated).
         building_id: unique ID for ZinD building.
         floor_id: unique ID for floor of a ZinD building.
         i2Si1: Similarity(2) transformation, such that p_i2 = i2Si1 * p_i1.
     """
 
+    # Tens of thousands of instances may be created per floor, so avoid a per-instance `__dict__`.
+    # (`@dataclass(slots=True)` would require Python 3.10+.)
+    __slots__ = (
+        "i1",
+        "i2",
+        "prob",
+        "y_hat",
+        "y_true",
+        "pair_idx",
+        "wdo_pair_uuid",
+        "configuration",
+        "building_id",
+        "floor_id",
+        "i2Si1",
+    )
+
     i1: int
     i2: int
     prob: float
@@ -73,6 +102,113 @@ class EdgeClassification:
         return rot_error_deg, trans_error
 
 
+# Data type of each array in `EdgeClassificationArrays`.
+_EDGE_CLASSIFICATION_ARRAY_DTYPES = {
+    "i1": np.int32,
+    "i2": np.int32,
+    "prob": np.float32,
+    "y_hat": np.int8,
+    "y_true": np.int8,
+    "pair_idx": np.int32,
+}
+
+
+@dataclass(frozen=True)
+class EdgeClassificationArrays:
+    """Model predictions for all alignment hypotheses on a single floor, stored as parallel arrays.
+
+    Unlike EdgeClassification, no relative pose is attached, so no alignment hypothesis files need to be read.
+
+    Attributes:
+        i1: array of shape (N,) representing ID of panorama 1 for each hypothesis.
+        i2: array of shape (N,) representing ID of panorama 2 for each hypothesis.
+        prob: array of shape (N,) representing probability of predicted category.
+        y_hat: array of shape (N,) representing predicted category.
+        y_true: array of shape (N,) representing true category.
+        pair_idx: array of shape (N,) representing index of each alignment hypothesis pair.
+    """
+
+    i1: np.ndarray
+    i2: np.ndarray
+    prob: np.ndarray
+    y_hat: np.ndarray
+    y_true: np.ndarray
+    pair_idx: np.ndarray
+
+    def __len__(self) -> int:
+        """Return the number of alignment hypotheses."""
+        return self.y_hat.shape[0]
+
+
+def _split_fpath(fpath: str) -> Tuple[str, str]:
+    """Split a serialized image file path into the name of its parent directory and its stem, using string ops only.
+
+    Args:
+        fpath: image file path, e.g. `{building_id}/pair_3905___door_3_0_identity_..._pano_38.jpg`.
+
+    Returns:
+        parent_name: name of parent directory (the ZInD building ID), equivalent to `Path(fpath).parent.stem`.
+        stem: file name without extension, equivalent to `Path(fpath).stem`.
+    """
+    parts = fpath.rsplit("/", 2)
+    parent_name = parts[-2] if len(parts) > 1 else ""
+    return parent_name.rsplit(".", 1)[0], parts[-1].rsplit(".", 1)[0]
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_pred_fpath(fpath: str) -> Tuple[int, str, str, str, str, str]:
+    """Parse all fields encoded in the file path of a serialized prediction's image.
+
+    Results are cached, since the same batches are re-read for every floor (e.g. by `run_sfm.py`).
+
+    Args:
+        fpath: image file path, e.g.
+            `{building_id}/pair_3905___door_3_0_identity_floor_rgb_floor_01_partial_room_02_pano_38.jpg`.
+
+    Returns:
+        pano_id: ID of the panorama the image was rendered from.
+        building_id: unique ID for ZinD building.
+        floor_id: unique ID for floor of a ZinD building.
+        pair_idx: index of the alignment hypothesis pair.
+        configuration: surface normal configuration (identity or rotated).
+        wdo_pair_uuid: ID of the W/D/O pair used for the alignment hypothesis, e.g. `door_3_0`.
+    """
+    building_id, stem = _split_fpath(fpath)
+    match = _PRED_FPATH_STEM_PATTERN.fullmatch(stem)
+    if match is None:
+        raise ValueError(f"Unexpected file name for serialized prediction: {fpath}")
+    pair_idx, wdo_pair_uuid, configuration, floor_id, pano_id = match.group(
+        "pair_idx", "wdo_pair_uuid", "configuration", "floor_id", "pano_id"
+    )
+    # Only a handful of distinct values are shared by all records, so intern them to keep a single copy of each.
+    return (
+        int(pano_id),
+        sys.intern(building_id),
+        sys.intern(floor_id),
+        pair_idx,
+        sys.intern(configuration),
+        sys.intern(wdo_pair_uuid),
+    )
+
+
+def _read_serialized_pred_batches(serialized_preds_json_dir: str) -> Iterator[Dict[str, Any]]:
+    """Read all serialized prediction batches from a directory in file name order, loading several files concurrently.
+
+    Args:
+        serialized_preds_json_dir: path to directory where model predictions (per edge) have been serialized as JSON.
+
+    Yields:
+        Deserialized contents of each `batch*.json` file.
+    """
+    json_fpaths = sorted(
+        entry.path
+        for entry in os.scandir(serialized_preds_json_dir)
+        if entry.name.startswith("batch") and entry.name.endswith(".json") and entry.is_file()
+    )
+    with ThreadPoolExecutor(max_workers=MAX_JSON_LOADING_THREADS) as executor:
+        yield from tqdm.tqdm(executor.map(io_utils.read_json_file, json_fpaths), total=len(json_fpaths))
+
+
 def get_available_floor_ids_building_ids_from_serialized_preds(serialized_preds_json_dir: str) -> List[Tuple[str, str]]:
     """Identify unique (building id, floor id) pairs for which serialized SALVe predictions are available on disk.
 
@@ -85,15 +221,10 @@ def get_available_floor_ids_building_ids_from_serialized_preds(serialized_preds_
     """
     building_id_floor_id_pairs = set()
 
-    json_fpaths = glob.glob(f"{serialized_preds_json_dir}/batch*.json")
-    for json_fpath in tqdm.tqdm(json_fpaths):
-        json_data = io_utils.read_json_file(json_fpath)
+    for json_data in _read_serialized_pred_batches(serialized_preds_json_dir):
         fp0_list = json_data["fp0"]
         for fp0 in fp0_list:
-            building_id = Path(fp0).parent.stem
-            s = Path(fp0).stem.find("floor_0")
-            e = Path(fp0).stem.find("_partial")
-            floor_id = Path(fp0).stem[s:e]
+            _, building_id, floor_id, _, _, _ = _parse_pred_fpath(fp0)
 
             building_id_floor_id_pairs.add((building_id, floor_id))
 
@@ -128,12 +259,11 @@ def get_edge_classifications_from_serialized_preds(
             measurements.
     """
     floor_edgeclassifications_dict = defaultdict(list)
+    # Only records from the queried floor are kept, so all of them go to a single list.
+    query_measurements = []
 
-    json_fpaths = glob.glob(f"{serialized_preds_json_dir}/batch*.json")
     print("Converting serialized CNN predictions to relative poses / EdgeClassifications...")
-    for json_fpath in tqdm.tqdm(json_fpaths):
-
-        json_data = io_utils.read_json_file(json_fpath)
+    for json_data in _read_serialized_pred_batches(serialized_preds_json_dir):
         y_hat_list = json_data["y_hat"]
         y_true_list = json_data["y_true"]
         y_hat_prob_list = json_data["y_hat_probs"]
@@ -142,35 +272,20 @@ def get_edge_classifications_from_serialized_preds(
 
         for y_hat, y_true, y_hat_prob, fp0, fp1 in zip(y_hat_list, y_true_list, y_hat_prob_list, fp0_list, fp1_list):
             # Note: not guaranteed that i1 < i2
-            i1_ = int(Path(fp0).stem.split("_")[-1])
-            i2_ = int(Path(fp1).stem.split("_")[-1])
+            i1_, building_id, floor_id, pair_idx, configuration, wdo_pair_uuid = _parse_pred_fpath(fp0)
+            i2_ = _parse_pred_fpath(fp1)[0]
 
             # TODO: this should never happen bc sorted, figure out why it occurs
             # (happens because we sort by partial room, not by i1, i2 in dataloader?)
             i1 = min(i1_, i2_)
             i2 = max(i1_, i2_)
 
-            building_id = Path(fp0).parent.stem
             if building_id != query_building_id:
                 continue
 
-            s = Path(fp0).stem.find("floor_0")
-            e = Path(fp0).stem.find("_partial")
-            floor_id = Path(fp0).stem[s:e]
-
             if floor_id != query_floor_id:
                 continue
 
-            pair_idx = Path(fp0).stem.split("_")[1]
-
-            is_identity = "identity" in Path(fp0).stem
-            configuration = "identity" if is_identity else "rotated"
-
-            # Rip out the WDO indices (`wdo_pair_uuid`), given a filename such as
-            # `pair_3905___door_3_0_identity_floor_rgb_floor_01_partial_room_02_pano_38.jpg`
-            k = Path(fp0).stem.split("___")[1].find(f"_{configuration}")
-            assert k != -1
-            wdo_pair_uuid = Path(fp0).stem.split("___")[1][:k]
             # split `door_3_0` to `door`
             wdo_type = wdo_pair_uuid.split("_")[0]
             if wdo_type not in allowed_wdo_types:
@@ -192,24 +307,68 @@ def get_edge_classifications_from_serialized_preds(
             json_fpath = fpaths[0]
             i2Si1 = Sim2.from_json(json_fpath)
 
-            floor_edgeclassifications_dict[(building_id, floor_id)] += [
+            query_measurements.append(
                 EdgeClassification(
                     i1=i1,
                     i2=i2,
                     prob=y_hat_prob,
                     y_hat=y_hat,
                     y_true=y_true,
-                    pair_idx=pair_idx,
+                    pair_idx=int(pair_idx),
                     wdo_pair_uuid=wdo_pair_uuid,
                     configuration=configuration,
                     building_id=building_id,
                     floor_id=floor_id,
                     i2Si1=i2Si1,
                 )
-            ]
+            )
+
+    if len(query_measurements) > 0:
+        floor_edgeclassifications_dict[(query_building_id, query_floor_id)] = query_measurements
     return floor_edgeclassifications_dict
 
 
+def get_edge_classification_arrays_from_serialized_preds(
+    serialized_preds_json_dir: str,
+) -> Dict[Tuple[str, str], EdgeClassificationArrays]:
+    """Converts serialized predictions into parallel arrays, per ZinD building and per floor.
+
+    Args:
+        serialized_preds_json_dir: Path to directory where model predictions (per edge) have been serialized as JSON.
+            The serializations are stored per batch, and thus are mixed across ZInD buildings and floors.
+
+    Returns:
+        Mapping from (building_id, floor_id) to predictions for all alignment hypotheses on that floor.
+    """
+    columns_by_floor = defaultdict(lambda: {name: [] for name in _EDGE_CLASSIFICATION_ARRAY_DTYPES})
+    # Consecutive records usually come from the same floor, so reuse the last floor's columns when possible.
+    last_key = None
+
+    for json_data in _read_serialized_pred_batches(serialized_preds_json_dir):
+        for y_hat, y_true, y_hat_prob, fp0, fp1 in zip(
+            json_data["y_hat"], json_data["y_true"], json_data["y_hat_probs"], json_data["fp0"], json_data["fp1"]
+        ):
+            # Note: not guaranteed that i1 < i2
+            i1_, building_id, floor_id, pair_idx, _, _ = _parse_pred_fpath(fp0)
+            i2_ = _parse_pred_fpath(fp1)[0]
+
+            if (building_id, floor_id) != last_key:
+                last_key = (building_id, floor_id)
+                columns = columns_by_floor[last_key]
+            columns["i1"].append(min(i1_, i2_))
+            columns["i2"].append(max(i1_, i2_))
+            columns["prob"].append(y_hat_prob)
+            columns["y_hat"].append(y_hat)
+            columns["y_true"].append(y_true)
+            columns["pair_idx"].append(int(pair_idx))
+
+    dtypes = _EDGE_CLASSIFICATION_ARRAY_DTYPES
+    return {
+        key: EdgeClassificationArrays(**{name: np.asarray(columns[name], dtype=dtypes[name]) for name in dtypes})
+        for key, columns in columns_by_floor.items()
+    }
+
+
 def get_conf_thresholded_edge_measurements(
     measurements: List[EdgeClassification], confidence_threshold: float
 ) -> List[EdgeClassification]:
@@ -281,7 +440,7 @@ def get_most_likely_relative_pose_per_edge(
     """
     most_confident_edge_dict = defaultdict(list)
     for m in measurements:
-        most_confident_edge_dict[(m.i1, m.i2)] += [m]
+        most_confident_edge_dict[(m.i1, m.i2)].append(m)
 
     per_edge_wdo_dict: Dict[Tuple[int, int], EdgeWDOPair] = {}
     edge_classification_dict: Dict[Tuple[int, int], EdgeClassification] = {}
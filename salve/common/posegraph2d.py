@@ -85,10 +85,7 @@ class PoseGraph2d(NamedTuple):
             camera_height_m: camera height above the floor, in meters.
         """
         if pano_id not in self.nodes:
-            print(f"Pano id {pano_id} not found among {self.nodes.keys()}")
-            import pdb
-
-            pdb.set_trace()
+            raise ValueError(f"Pano id {pano_id} not found among {list(self.nodes.keys())}")
 
         # from zillow_floor_map["scale_meters_per_coordinate"][floor_id]
         worldmetric_s_worldnormalized = self.scale_meters_per_coordinate
@@ -511,18 +508,14 @@ def convert_Sim3_to_Sim2(a_Sim3_b: Similarity3) -> Sim2:
     MAX_ALLOWED_RX_DEV = 0.1
     MAX_ALLOWED_RY_DEV = 0.1
     if np.absolute(rx) > MAX_ALLOWED_RX_DEV or np.absolute(ry) > MAX_ALLOWED_RY_DEV:
-        import pdb
-
-        pdb.set_trace()
+        raise ValueError(f"Sim(3) has non-planar rotation (rx={rx:.2f}, ry={ry:.2f} deg.), cannot convert to Sim(2).")
 
     assert np.isclose(rz, theta_deg, atol=0.1)
 
     atb = a_Sim3_b.translation()
     MAX_ALLOWED_TZ_DEG = 0.1
     if np.absolute(atb[2]) > MAX_ALLOWED_TZ_DEG:
-        import pdb
-
-        pdb.set_trace()
+        raise ValueError(f"Sim(3) has non-planar translation (tz={atb[2]:.2f}), cannot convert to Sim(2).")
 
     a_Sim2_b = Sim2(R=a_Rot2_b, t=atb[:2], s=a_Sim3_b.scale())
     return a_Sim2_b
@@ -3,26 +3,15 @@
 from typing import Any, Dict, List, Optional, Tuple
 
 import math
-import matplotlib
-import matplotlib.pyplot as plt
-import shapely.ops
-from matplotlib.axes import SubplotBase
+from matplotlib import rcParams
+from matplotlib.axes import Axes, SubplotBase
 from matplotlib.figure import Figure
-from shapely.geometry import Point, Polygon
 
 from salve.stitching.transform import transform_xy_by_pose
 from salve.stitching.models.feature2d import Feature2dXy
 from salve.stitching.models.locations import ORIGIN_POSE, Pose, Point2d
 from salve.stitching.models.floor_map_object import FloorMapObject
 
-# TODO: remove this logic
-try:
-    matplotlib.use("macOSX")
-except:
-    #matplotlib.use("Agg")
-    print("Could not load macOSX backend")
-
-
 TANGO_COLOR_PALETTE = [
     [252, 233, 79],
     [237, 212, 0],
@@ -54,7 +43,7 @@ TANGO_COLOR_PALETTE = [
 ]
 
 
-def draw_dwo_xy_top_down_canvas(axis: plt.Axes, fig, filename: str, dwos_cluster_all: Dict[int, Any]) -> None:
+def draw_dwo_xy_top_down_canvas(axis: Axes, fig, filename: str, dwos_cluster_all: Dict[int, Any]) -> None:
     """TODO
 
     Args:
@@ -167,26 +156,39 @@ def draw_camera_in_top_down_canvas(axis: SubplotBase, pose: Pose, color: str, si
 
 
 def draw_all_room_shapes_with_given_poses_and_shapes(
-    filename: str, floor_map_gt: Any, panoid_refs: Any, predictions: Any, confidences: Any, poses: Any, groups: Any
-) -> Tuple[plt.Axes, Figure]:
-    """TODO
+    filename: str,
+    floor_map_gt: Any,
+    panoid_refs: Any,
+    predictions_by_title: Dict[str, Any],
+    confidences: Any,
+    poses: Any,
+    groups: Any,
+    figure: Optional[Figure] = None,
+) -> Tuple[List[Axes], Figure]:
+    """Draw the posed room shapes of all panos, with one subplot (sharing axis limits) per room shape variant.
+
+    All variants are drawn into a single figure, which is saved once.
 
     Args:
         filename:
         floor_map_gt: ground truth floor map.
         panoid_refs:
-        predictions:
+        predictions_by_title: mapping from subplot title to per-pano room shapes (e.g. corner-based or dense shapes).
         confidences:
         poses:
         groups:
+        figure: empty figure to draw on. If omitted, a new figure is created.
 
     Returns:
-        axis:
+        axes: one subplot per room shape variant.
         fig:
     """
-    floor_map_gt_obj = FloorMapObject(floor_map_gt)
-    fig = Figure()
-    axis = fig.add_subplot(1, 1, 1)
+    fig = figure if figure is not None else Figure()
+    fig_width, fig_height = rcParams["figure.figsize"]
+    fig.set_size_inches(fig_width * len(predictions_by_title), fig_height)
+    axes = fig.subplots(1, len(predictions_by_title), sharex=True, sharey=True, squeeze=False)[0]
+    for axis, title in zip(axes, predictions_by_title):
+        axis.set_title(title)
 
     for i_group, group in enumerate(groups):
         # color = hsv2rgb(i_group / len(groups), 1, 1)
@@ -194,31 +196,37 @@ def draw_all_room_shapes_with_given_poses_and_shapes(
         color = TANGO_COLOR_PALETTE[(i_color) % 24]
         # color = (color[0]/255, color[1]/255, color[2]/255)
         for panoid in group:
-            room_shape = predictions[panoid]
             pose = poses[panoid]
-
-            shape = [Point2d(x, room_shape.boundary.xy[1][i]) for i, x in enumerate(room_shape.boundary.xy[0])]
-            shape.append(Point2d(room_shape.boundary.xy[0][0], room_shape.boundary.xy[1][0]))
             confidence = confidences[panoid] if confidences else None
-            # draw_shape_in_top_down_canvas(axis, shape, "black", confidences=confidence, pose=pose, linewidth=0.5)
-            # draw_camera_in_top_down_canvas(axis, pose, (color[0]/255, color[1]/255, color[2]/255), size=20)
-
-            draw_shape_in_top_down_canvas(
-                axis, xys=shape, color="black", confidences=confidence, pose=pose, linewidth=0.5
-            )
-            draw_camera_in_top_down_canvas(axis, pose=pose, color="blue", size=20)
-
-    # axis.set_xlim([-1.1, 1.7])
-    # axis.set_ylim([-1.5, 2.5])
-    axis.set_aspect("equal")
+            for axis, predictions in zip(axes, predictions_by_title.values()):
+                room_shape = predictions[panoid]
+                shape = [Point2d(x, room_shape.boundary.xy[1][i]) for i, x in enumerate(room_shape.boundary.xy[0])]
+                shape.append(Point2d(room_shape.boundary.xy[0][0], room_shape.boundary.xy[1][0]))
+                # draw_shape_in_top_down_canvas(axis, shape, "black", confidences=confidence, pose=pose, linewidth=0.5)
+                # draw_camera_in_top_down_canvas(axis, pose, (color[0]/255, color[1]/255, color[2]/255), size=20)
+
+                draw_shape_in_top_down_canvas(
+                    axis, xys=shape, color="black", confidences=confidence, pose=pose, linewidth=0.5
+                )
+                draw_camera_in_top_down_canvas(axis, pose=pose, color="blue", size=20)
+
+    for axis in axes:
+        # axis.set_xlim([-1.1, 1.7])
+        # axis.set_ylim([-1.5, 2.5])
+        axis.set_aspect("equal")
     fig.savefig(filename)
-    return [axis, fig]
+    return [list(axes), fig]
 
 
 def draw_all_room_shapes_with_poses(
-    filename: str, floor_map: Any, panoid_refs: Any, arkit_points: List[Any] = [], axis=None
-) -> Any:
-    """TODO
+    filename: str,
+    floor_map: Any,
+    panoid_refs: Any,
+    arkit_points: List[Any] = [],
+    axis=None,
+    floor_map_obj: Optional[FloorMapObject] = None,
+) -> None:
+    """Draw the GT room shape and camera of each given pano, at the pano's global pose.
 
     Args:
         filename:
@@ -226,28 +234,21 @@ def draw_all_room_shapes_with_poses(
         panoid_refs:
         arkit_points:
         axis:
-
-    Returns:
-        Shapely object representing the union of all ...
+        floor_map_obj: `floor_map`, already wrapped as a FloorMapObject. If provided, its cached
+            pano poses are reused instead of wrapping `floor_map` again.
     """
     if not axis:
         fig = Figure()
         axis = fig.add_subplot(1, 1, 1)
 
-    floor_map_obj = FloorMapObject(floor_map)
-    shapes_union = []
+    if floor_map_obj is None:
+        floor_map_obj = FloorMapObject(floor_map)
     for panoid in panoid_refs:
         rsid = floor_map["panos"][panoid]["room_shape_id"]
         room_shape = floor_map["room_shapes"][rsid]
         pose_ref = floor_map_obj.get_pano_global_pose(panoid)
 
         shape = [Point2d(v["x"], v["y"]) for v in room_shape["vertices"]]
-        xys = shape
-        xys_transformed = []
-        for xy in xys:
-            xys_transformed.append(transform_xy_by_pose(xy, pose_ref))
-        shapes_union.append(Polygon([[xy.x, xy.y] for xy in xys_transformed]))
-
         shape.append(Point2d(room_shape["vertices"][0]["x"], room_shape["vertices"][0]["y"]))
         draw_shape_in_top_down_canvas(axis, shape, "black", pose=pose_ref, linewidth=0.5)
         draw_camera_in_top_down_canvas(axis, pose_ref, "black", size=10)
@@ -261,5 +262,3 @@ def draw_all_room_shapes_with_poses(
     axis.set_aspect("equal")
     if filename:
         fig.savefig(filename)
-
-    return shapely.ops.cascaded_union(shapes_union)
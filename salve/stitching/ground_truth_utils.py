@@ -2,7 +2,12 @@
 
 import math
 from copy import deepcopy
-from typing import Any
+from typing import Any, List
+
+import numpy as np
+from shapely.geometry import Polygon
+
+import salve.stitching.transform as transform_utils
 
 
 def convert_floor_map_to_localization_cluster(floor_map_object: Any) -> Any:
@@ -32,6 +37,26 @@ def convert_floor_map_to_localization_cluster(floor_map_object: Any) -> Any:
     return clusters_all
 
 
+def get_posed_room_shape_polygons(floor_map_object: Any, panoids: List[str]) -> List[Polygon]:
+    """Get the GT room shape of each given pano, in global coordinates.
+
+    Args:
+        floor_map_object: ground truth floor map.
+        panoids: IDs of panos, whose room shapes are defined in their own coordinate systems (i.e. primary panos).
+
+    Returns:
+        room_polys: room shape polygon of each pano, placed at the pano's global pose.
+    """
+    room_polys = []
+    for panoid in panoids:
+        rsid = floor_map_object.data["panos"][panoid]["room_shape_id"]
+        vertices = floor_map_object.data["room_shapes"][rsid]["vertices"]
+        xys = np.array([[v["x"], v["y"]] for v in vertices])
+        pose_ref = floor_map_object.get_pano_global_pose(panoid)
+        room_polys.append(Polygon(transform_utils.transform_xys_by_pose(xys, pose_ref)))
+    return room_polys
+
+
 def align_pred_poses_with_gt(floor_map_gt_object: Any, cluster: Any) -> Any:
     """We align two pose graphs by SE(2), not Sim(2), setting first pose of each to the same pose??
 
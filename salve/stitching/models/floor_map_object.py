@@ -23,6 +23,12 @@ class FloorMapObject:
                 for panoid, pano in self.data["room_shapes"][rsid]["panos"].items():
                     self.floor_ids_by_panoid[panoid] = fsid
 
+        self.panoids_by_floor_id = {}
+        for panoid, fsid in self.floor_ids_by_panoid.items():
+            self.panoids_by_floor_id.setdefault(fsid, []).append(panoid)
+        # Global poses are queried repeatedly for the same panoramas (e.g. once per cluster), so they are memoized.
+        self._global_pose_by_panoid: Dict[str, Pose] = {}
+
     def _generate_room_shape_floor_shape_association(self) -> None:
         """TODO"""
         self.fsids = {}
@@ -56,7 +62,7 @@ class FloorMapObject:
         Returns:
             List of ...
         """
-        return [panoid for panoid, floor_id in self.floor_ids_by_panoid.items() if floor_id == floor_shape_id]
+        return list(self.panoids_by_floor_id.get(floor_shape_id, []))
 
     def get_floor_map_scale(self) -> float:
         """TODO:
@@ -76,13 +82,17 @@ class FloorMapObject:
         Returns:
             TODO
         """
+        if panoid in self._global_pose_by_panoid:
+            return self._global_pose_by_panoid[panoid]
+
         room_shape_id = self.data["panos"][panoid]["room_shape_id"]
         room_shape_pano = self.data["room_shapes"][room_shape_id]["panos"][panoid]
         pose = Pose(
             position=Point2d(x=room_shape_pano["position"]["x"], y=room_shape_pano["position"]["y"]),
             rotation=room_shape_pano["rotation"],
         )
-        return self.get_global_pose_from_pose_in_room_cs(room_shape_id, pose)
+        self._global_pose_by_panoid[panoid] = self.get_global_pose_from_pose_in_room_cs(room_shape_id, pose)
+        return self._global_pose_by_panoid[panoid]
 
     def get_global_pose_from_pose_in_room_cs(self, room_shape_id: str, pose: Pose) -> Pose:
         """TODO
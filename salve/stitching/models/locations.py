@@ -8,6 +8,9 @@ import numpy as np
 
 # TODO: Use shapely Point2d instead.
 class Point2d:
+    # Many thousands of points are created per floor, so per-instance dicts are avoided.
+    __slots__ = ("x", "y")
+
     def __init__(self, x: float, y: float) -> None:
         self.x = x
         self.y = y
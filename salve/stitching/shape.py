@@ -3,12 +3,12 @@
 import json
 import math
 import os
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from matplotlib.figure import Figure
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
+import shapely
 import shapely.ops
 from shapely.geometry import Point, Polygon
 from tqdm import tqdm
@@ -99,6 +99,38 @@ def load_room_shape_polygon_from_predictions(
     return Polygon(xys)
 
 
+def subdivide_polygon(polygon: Any, max_vertices: int = 256) -> List[Any]:
+    """Split a complex (multi)polygon into tiles with a bounded number of vertices.
+
+    The geometry is recursively cut in half along the longest side of its bounding box. Predicates and overlays
+    on small tiles are much cheaper than on a single geometry with many vertices, and the tiles cover the
+    geometry exactly, so areas of intersection with the tiles can be summed up.
+
+    Args:
+        polygon: Polygon or MultiPolygon to subdivide.
+        max_vertices: maximum number of vertices of each tile.
+
+    Returns:
+        tiles: non-empty geometries covering `polygon`, each with at most `max_vertices` vertices (unless a
+            geometry cannot be split further).
+    """
+    if polygon.is_empty:
+        return []
+    xmin, ymin, xmax, ymax = polygon.bounds
+    width = xmax - xmin
+    height = ymax - ymin
+    if shapely.get_num_coordinates(polygon) <= max_vertices or max(width, height) == 0:
+        return [polygon]
+
+    if width >= height:
+        xmid = xmin + width / 2
+        rects = [(xmin, ymin, xmid, ymax), (xmid, ymin, xmax, ymax)]
+    else:
+        ymid = ymin + height / 2
+        rects = [(xmin, ymin, xmax, ymid), (xmin, ymid, xmax, ymax)]
+    return [tile for rect in rects for tile in subdivide_polygon(shapely.clip_by_rect(polygon, *rect), max_vertices)]
+
+
 def generate_dense_shape(v_vals: List[Any], uncertainty: Any) -> Tuple[Any, Any]:
     """TODO
 
@@ -110,16 +142,48 @@ def generate_dense_shape(v_vals: List[Any], uncertainty: Any) -> Tuple[Any, Any]
         polygon:
         distances:
     """
-    vs = np.asarray(v_vals) / IMAGE_HEIGHT_PX
-    us = np.asarray(range(IMAGE_WIDTH_PX)) / IMAGE_WIDTH_PX
-    uvs = [[us[i], vs[i]] for i in range(IMAGE_WIDTH_PX)]
-    polygon, poly_upper = load_room_shape_polygon_from_predictions(uvs, uncertainty)
-    distances = []
-    xys = polygon.boundary.xy
-    xys_upper = poly_upper.boundary.xy
-    for i in range(len(xys[0])):
-        distances.append(math.sqrt((xys_upper[0][i] - xys[0][i]) ** 2 + (xys_upper[1][i] - xys[1][i]) ** 2))
-    return polygon, distances
+    return generate_dense_shapes(np.asarray([v_vals]), np.asarray([uncertainty]))[0]
+
+
+def generate_dense_shapes(
+    v_vals: np.ndarray, uncertainty: np.ndarray, camera_height: float = DEFAULT_CAMERA_HEIGHT
+) -> List[Tuple[Polygon, List[float]]]:
+    """Generate dense room shapes from the per-column floor boundaries of a batch of panoramas.
+
+    Equivalent to calling `generate_dense_shape()` on each panorama, but the projection to the ground plane
+    is computed in a single vectorized pass over all panoramas.
+
+    Args:
+        v_vals: array of shape (N, IMAGE_WIDTH_PX) representing the floor boundary (image row, in pixels) of each
+            image column, for each of N panoramas.
+        uncertainty: array of shape (N, IMAGE_WIDTH_PX) representing the uncertainty (in pixels) of each boundary
+            point.
+        camera_height: height of the camera above the floor.
+
+    Returns:
+        List of length N, with, for each panorama, the dense room shape polygon and, for each of its boundary
+            vertices, the distance to the corresponding vertex shifted upwards by the uncertainty.
+    """
+    # Only every other image column is used (matching `load_room_shape_polygon_from_predictions()`), sampled at
+    # the pixel center.
+    column_idxs = np.arange(1, IMAGE_WIDTH_PX, 2)
+    us = np.asarray(range(IMAGE_WIDTH_PX))[column_idxs] / IMAGE_WIDTH_PX + 0.5 / IMAGE_WIDTH_PX
+    vs = v_vals[:, column_idxs] / IMAGE_HEIGHT_PX + 0.5 / IMAGE_HEIGHT_PX
+    vs_upper = vs - uncertainty[:, column_idxs] / IMAGE_HEIGHT_PX
+
+    xs, ys = transform_utils.uvs_to_xys(np.broadcast_to(us, vs.shape), vs, camera_height)
+    xs_upper, ys_upper = transform_utils.uvs_to_xys(np.broadcast_to(us, vs.shape), vs_upper, camera_height)
+
+    dense_shapes = []
+    for i in range(len(v_vals)):
+        polygon = Polygon(np.stack([xs[i], ys[i]], axis=1))
+        # Compare vertices of the closed rings, including the repeated first vertex.
+        xys = np.asarray(polygon.boundary.xy)
+        xys_upper = np.asarray(Polygon(np.stack([xs_upper[i], ys_upper[i]], axis=1)).boundary.xy)
+        distances = np.sqrt((xys_upper[0] - xys[0]) ** 2 + (xys_upper[1] - xys[1]) ** 2)
+        dense_shapes.append((polygon, distances.tolist()))
+    return dense_shapes
+
 
 def group_panos_by_room(predictions: Any, location_panos: Any) -> List[List[int]]:
     """Form per-room clusters of panoramas according to layout IoU and other overlap measures.
@@ -185,82 +249,49 @@ def refine_shape_group_start_with(
     panoid = start_id
     # for panoid in group:
     current_shape = predicted_shapes[panoid]
-    xys0 = extract_coordinates_from_shapely_polygon(current_shape)
     pose0 = location_panos[panoid]
     wall_conf0 = wall_confidences[panoid]
-    uvs0 = []
-    for xy0 in xys0:
-        uvs0.append(transform_utils.xy_to_uv(xy0, DEFAULT_CAMERA_HEIGHT))
-
-    # fig = Figure()
-    # axis = fig.add_subplot(1, 1, 1)
+    uvs0 = transform_utils.xys_to_uvs(np.asarray(current_shape.boundary.xy).T, DEFAULT_CAMERA_HEIGHT)
 
     final_vs_all = {}
     final_cs_all = {}
-    colors = {"9c5d07356f": "red", "84fe28b6c1": "blue", "404ed9fcfb": "yellow", "1a2445a9fe": "purple"}
     for panoid_1 in group:
         if panoid_1 == panoid:
             continue
         shape1 = predicted_shapes[panoid_1]
         pose1 = location_panos[panoid_1]
         wall_conf1 = wall_confidences[panoid_1]
-        # print(group, panoid, panoid_1)
-
-        xys1 = extract_coordinates_from_shapely_polygon(shape1)
-        xys0 = extract_coordinates_from_shapely_polygon(current_shape)
-        xys1_projected = []
-        uvs1_projected = []
-        for xy1 in xys1:
-            xy1_transformed = transform_utils.transform_xy_by_pose(xy1, pose1)
-            xy1_projected = transform_utils.project_xy_by_pose(xy1_transformed, pose0)
-            xys1_projected.append(xy1_projected)
-            uvs1_projected.append(transform_utils.xy_to_uv(xy1_projected, DEFAULT_CAMERA_HEIGHT))
-
-        xys1_projected = [[xy.x, xy.y] for xy in xys1_projected]
+
+        # Bring the other pano's shape into the coordinate system of the start pano.
+        xys1 = np.asarray(shape1.boundary.xy).T
+        xys1_projected = transform_utils.project_xys_by_pose(transform_utils.transform_xys_by_pose(xys1, pose1), pose0)
         polygon_global = Polygon(xys1_projected)
         if not polygon_global.contains(Point(0, 0)):
             continue
 
+        uvs1_projected = [
+            Point2d(x=u, y=v) for u, v in transform_utils.xys_to_uvs(xys1_projected, DEFAULT_CAMERA_HEIGHT)
+        ]
         final_vs, final_cs = transform_utils.reproject_uvs_to(uvs1_projected, wall_conf1, panoid_1, start_id)
 
         final_vs_all[panoid_1] = final_vs
         final_cs_all[panoid_1] = final_cs
 
-        xys_render = []
-        for i, u in enumerate(original_us):
-            xy_render = transform_utils.uv_to_xy(Point2d(x=u, y=final_vs[i]), DEFAULT_CAMERA_HEIGHT)
-            xys_render.append(xy_render)
-
-    #     color = colors[panoid_1] if panoid_1 in colors else 'red'
-    #     draw_shape_in_top_down_canvas(
-    #         axis, xys_render, color, pose=location_panos[start_id]
-    #     )
-    #     draw_camera_in_top_down_canvas(axis, location_panos[panoid_1], color, size=20)
-    # color = colors[start_id] if start_id in colors else 'red'
-    # draw_shape_in_top_down_canvas(axis, xys0, color, pose=location_panos[start_id])
-    # draw_camera_in_top_down_canvas(axis, location_panos[start_id], color, size=20)
-    # axis.set_aspect("equal")
-    # path = f'./panoloc/scripts/outputs/2331de25-d580-7a65-f5cc-fc50f3f160e9/fused/cluster_0/group_0_c_{start_id}.png'
-    # fig.savefig(path, dpi = 300)
-
-    xys1_final = []
-    conf1_final = []
-    for i, u in enumerate(original_us):
-        v = uvs0[i].y
-        current_c = wall_conf0[i]
-        for panoid_new in final_vs_all:
-            if current_c > final_cs_all[panoid_new][i] and final_vs_all[panoid_new][i] != 0:
-                v = final_vs_all[panoid_new][i]
-                current_c = final_cs_all[panoid_new][i]
-        xy1_final = transform_utils.uv_to_xy(Point2d(x=u, y=v), DEFAULT_CAMERA_HEIGHT)
-        xys1_final.append(Point2d(x=xy1_final.x, y=xy1_final.y))
-        
-        if (i > 0) and (xys1_final[i - 1].distance(xy1_final) > 0.03):
-            current_c = 0
-        if (i < len(xys1_final) - 1) and (xys1_final[i + 1].distance(xy1_final) > 0.03):
-            current_c = 0
-        conf1_final.append(current_c)
-    return xys1_final, conf1_final
+    # For each image column, keep the boundary from the most confident pano (lower is more confident).
+    vs_final = uvs0[:RES, 1]
+    conf1_final = np.asarray(wall_conf0[:RES], dtype=np.float64)
+    for panoid_new in final_vs_all:
+        is_more_confident = (conf1_final > final_cs_all[panoid_new]) & (final_vs_all[panoid_new] != 0)
+        vs_final = np.where(is_more_confident, final_vs_all[panoid_new], vs_final)
+        conf1_final = np.where(is_more_confident, final_cs_all[panoid_new], conf1_final)
+    xs_final, ys_final = transform_utils.uvs_to_xys(original_us, vs_final, DEFAULT_CAMERA_HEIGHT)
+
+    # Discard the confidence of points that are far from the previous point, i.e. at discontinuities.
+    distances_to_previous = np.sqrt(np.diff(xs_final) ** 2 + np.diff(ys_final) ** 2)
+    conf1_final[1:][distances_to_previous > 0.03] = 0
+
+    xys1_final = [Point2d(x=x, y=y) for x, y in zip(xs_final.tolist(), ys_final.tolist())]
+    return xys1_final, conf1_final.tolist()
 
 
 def refine_predicted_shape(
@@ -270,6 +301,8 @@ def refine_predicted_shape(
     location_panos: Any,
     cluster_dir: Any,
     tour_dir: Any = None,
+    figure: Optional[Figure] = None,
+    dpi: int = 300,
 ) -> Tuple[Any, Any, Any]:
     """Refine the predicted room shapes of each room (group) of a single building's floorplan.
 
@@ -280,13 +313,15 @@ def refine_predicted_shape(
         location_panos: TODO
         cluster_dir: TODO
         tour_dir: TODO
+        figure: empty figure to draw on. If omitted, a new figure is created.
+        dpi: resolution (dots per inch) of the saved figure (`final.png`).
 
     Returns:
         shape_fused_by_cluster: TODO
         fig2: TODO
         Cascaded union of ...
     """
-    fig2 = Figure()
+    fig2 = figure if figure is not None else Figure()
     axis2 = fig2.add_subplot(1, 2, 1)
 
     shape_fused_by_cluster = []
@@ -325,10 +360,8 @@ def refine_predicted_shape(
             # fig = Figure()
             # axis = fig.add_subplot(1, 1, 1)
 
-            xys_fused_transformed = []
-            for xy in xys_fused:
-                xys_fused_transformed.append(transform_utils.transform_xy_by_pose(xy, pose0))
-            shapes.append(Polygon([[xy.x, xy.y] for xy in xys_fused_transformed]))
+            xys_fused_arr = np.array([[xy.x, xy.y] for xy in xys_fused])
+            shapes.append(Polygon(transform_utils.transform_xys_by_pose(xys_fused_arr, pose0)))
 
             # draw_shape_in_top_down_canvas(axis, xys_fused, 'black', pose=pose0)
             # draw_shape_in_top_down_canvas(axis1, xys_fused, 'black', pose=pose0)
@@ -345,7 +378,7 @@ def refine_predicted_shape(
         # path_output = os.path.join(cluster_dir, f'group_{i_group}.png')
         # fig1.savefig(path_output, dpi = 300)
 
-        shape_fused_by_cluster_poly.append(shapely.ops.cascaded_union(shapes))
+        shape_fused_by_cluster_poly.append(shapely.ops.unary_union(shapes))
         #
         # try:
         #     xys_final = extract_coordinates_from_shapely_polygon(shape_fused)
@@ -357,5 +390,5 @@ def refine_predicted_shape(
 
     axis2.set_aspect("equal")
     path_output = os.path.join(cluster_dir, f"final.png")
-    fig2.savefig(path_output, dpi=300)
-    return shape_fused_by_cluster, fig2, shapely.ops.cascaded_union(shape_fused_by_cluster_poly)
+    fig2.savefig(path_output, dpi=dpi)
+    return shape_fused_by_cluster, fig2, shapely.ops.unary_union(shape_fused_by_cluster_poly)
@@ -159,6 +159,74 @@ def project_xy_by_pose(xy: Point2d, pose: Pose) -> Point2d:
     return Point2d(x=x_final, y=y_final)
 
 
+def transform_xys_by_pose(xys: np.ndarray, pose: Pose) -> np.ndarray:
+    """Vectorized `transform_xy_by_pose()`, for an array of points.
+
+    Args:
+        xys: array of shape (N,2) representing 2d points.
+        pose: TODO
+
+    Returns:
+        array of shape (N,2) representing the points rotated clockwise around the origin and translated by the pose.
+    """
+    rot_rad = math.radians(-pose.rotation)
+    x_rot = xys[:, 0] * math.cos(rot_rad) - xys[:, 1] * math.sin(rot_rad)
+    y_rot = xys[:, 0] * math.sin(rot_rad) + xys[:, 1] * math.cos(rot_rad)
+    return np.stack([x_rot + pose.position.x, y_rot + pose.position.y], axis=1)
+
+
+def project_xys_by_pose(xys: np.ndarray, pose: Pose) -> np.ndarray:
+    """Vectorized `project_xy_by_pose()`, for an array of points.
+
+    Args:
+        xys: array of shape (N,2) representing 2d points.
+        pose: TODO
+
+    Returns:
+        array of shape (N,2) representing the points in the coordinate system of the pose.
+    """
+    x_translated = xys[:, 0] - pose.position.x
+    y_translated = xys[:, 1] - pose.position.y
+    rot_rad = math.radians(pose.rotation)
+    x_final = x_translated * math.cos(rot_rad) - y_translated * math.sin(rot_rad)
+    y_final = x_translated * math.sin(rot_rad) + y_translated * math.cos(rot_rad)
+    return np.stack([x_final, y_final], axis=1)
+
+
+def xys_to_uvs(xys: np.ndarray, height: float) -> np.ndarray:
+    """Vectorized `xy_to_uv()`: compute texture coordinates from Cartesian coordinates, given camera height.
+
+    Args:
+        xys: array of shape (N,2) representing 2d points.
+        height: TODO
+
+    Returns:
+        array of shape (N,2) representing texture coordinates (u,v) in [0,1].
+    """
+    us = (np.arctan2(xys[:, 0], xys[:, 1]) / math.pi + 1.0) / 2.0
+    depths = np.sqrt(xys[:, 0] * xys[:, 0] + xys[:, 1] * xys[:, 1])
+    vs = 1.0 - np.arctan(depths / height) / math.pi
+    return np.stack([us, vs], axis=1)
+
+
+def uvs_to_xys(us: np.ndarray, vs: np.ndarray, height: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized `uv_to_xy()`: project texture coordinates to the ground plane, elementwise.
+
+    Args:
+        us: array of any shape, representing horizontal texture coordinates in [0,1].
+        vs: array of the same shape, representing vertical texture coordinates in [0,1].
+        height: TODO
+
+    Returns:
+        xs: array of the same shape, representing x coordinates on the ground plane.
+        ys: array of the same shape, representing y coordinates on the ground plane.
+    """
+    theta = math.pi - vs * math.pi
+    phi = ((us + 0.5) % 1.0) * math.pi * 2.0
+    scale = -height / -np.cos(theta)
+    return np.sin(theta) * np.sin(phi) * scale, np.sin(theta) * np.cos(phi) * scale
+
+
 def xy_to_depth(xy: Point2d) -> float:
     """Compute a xy point depth from origin.
 
@@ -2,7 +2,7 @@
 
 import logging
 from pathlib import Path
-from typing import Callable, Tuple
+from typing import Callable, Optional, Tuple
 
 import torch
 from torch import Tensor, nn
@@ -29,13 +29,15 @@ def cross_entropy_forward(
     """ """
     if split == "train":
         logits = model(x1, x2, x3, x4, x5, x6)
-        probs = torch.nn.functional.softmax(logits.clone(), dim=1)
+        # Probabilities are only used for metrics, so they are kept out of the autograd graph.
+        probs = torch.nn.functional.softmax(logits.detach(), dim=1)
         loss = torch.nn.functional.cross_entropy(logits, is_match.squeeze())
 
     else:
-        with torch.no_grad():
+        # Unlike `no_grad()`, inference mode also skips tracking tensor versions and views.
+        with torch.inference_mode():
             logits = model(x1, x2, x3, x4, x5, x6)
-            probs = torch.nn.functional.softmax(logits.clone(), dim=1)
+            probs = torch.nn.functional.softmax(logits, dim=1)
             loss = torch.nn.functional.cross_entropy(logits, is_match.squeeze())
 
     return probs, loss
@@ -124,41 +126,58 @@ def get_train_transform(args: TrainingConfig) -> Callable:
 
 
 def get_val_test_transform(args: TrainingConfig) -> Callable:
-    """Get data transforms for val or test split."""
+    """Get data transforms for val or test split.
+
+    Normalization is not included. Instead, it is applied to whole batches by `normalize_batch()`, once they
+    have been moved to the GPU.
+    """
     if len(args.modalities) == 1:
         Resize = transform.ResizePair
         Crop = transform.CropPair
         ToTensor = transform.ToTensorPair
-        Normalize = transform.NormalizePair
         Compose = transform.ComposePair
 
     elif len(args.modalities) == 2:
         Resize = transform.ResizeQuadruplet
         Crop = transform.CropQuadruplet
         ToTensor = transform.ToTensorQuadruplet
-        Normalize = transform.NormalizeQuadruplet
         Compose = transform.ComposeQuadruplet
 
     elif len(args.modalities) == 3:
         Resize = transform.ResizeSextuplet
         Crop = transform.CropSextuplet
         ToTensor = transform.ToTensorSextuplet
-        Normalize = transform.NormalizeSextuplet
         Compose = transform.ComposeSextuplet
 
-    mean, std = normalization_utils.get_imagenet_mean_std()
+    mean, _ = normalization_utils.get_imagenet_mean_std()
 
     # Uses deterministic center crops instead of random crops.
     transform_list = [
         Resize((args.resize_h, args.resize_w)),
         Crop(size=(args.train_h, args.train_w), crop_type="center", padding=mean),
         ToTensor(),
-        Normalize(mean=mean, std=std),
     ]
 
     return Compose(transform_list)
 
 
+def normalize_batch(*batch: Optional[Tensor]) -> None:
+    """Normalize batches of images in place with ImageNet statistics, on whichever device they reside on.
+
+    Used for val and test splits, whose data transforms leave images unnormalized (see `get_val_test_transform()`).
+
+    Args:
+        batch: tensors of shape (N,C,H,W), or None for modalities that are not used.
+    """
+    mean, std = normalization_utils.get_imagenet_mean_std()
+    for x in batch:
+        if x is None:
+            continue
+        mean_tensor = torch.tensor(mean, dtype=x.dtype, device=x.device).view(1, -1, 1, 1)
+        std_tensor = torch.tensor(std, dtype=x.dtype, device=x.device).view(1, -1, 1, 1)
+        x.sub_(mean_tensor).div_(std_tensor)
+
+
 def get_img_transform_list(args: TrainingConfig, split: str):
     """Get data transform for specified dataset split."""
     if split == "train":
@@ -189,6 +208,9 @@ def get_dataloader(args: TrainingConfig, split: str) -> torch.utils.data.DataLoa
     drop_last = True if split == "train" else False
     sampler = None
     shuffle = True if split == "train" else False
+    # Keep worker processes alive across epochs, instead of respawning them (and re-creating the dataset) every
+    # epoch, and let each worker prepare several batches ahead. Both options require worker processes.
+    worker_kwargs = {"persistent_workers": True, "prefetch_factor": 4} if args.workers > 0 else {}
 
     split_loader = torch.utils.data.DataLoader(
         split_data,
@@ -198,6 +220,7 @@ def get_dataloader(args: TrainingConfig, split: str) -> torch.utils.data.DataLoa
         pin_memory=True,
         drop_last=drop_last,
         sampler=sampler,
+        **worker_kwargs,
     )
     return split_loader
 
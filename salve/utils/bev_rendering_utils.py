@@ -1,7 +1,11 @@
 """Utilities for rendering bird's eye view texture maps."""
 
+import functools
 import os
+import queue
+import threading
 from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from types import SimpleNamespace
 from typing import Dict, List, Optional, Tuple, Union
@@ -30,6 +34,17 @@ GREEN = [0, 255, 0]
 BLUE = [0, 0, 255]
 WDO_COLOR_DICT_CV2 = {"windows": RED, "doors": GREEN, "openings": BLUE}
 
+# Matches the default JPEG quality of imageio's (Pillow) writer, so encoded renderings are unchanged.
+BEV_JPEG_QUALITY = 75
+
+# Z-coordinate range (zmin,zmax] of the points that are rendered for each surface type, relative to the camera.
+SURFACE_CROP_Z_RANGES = {
+    # Keep everything 1 meter and below the camera
+    "floor": (-float("inf"), -1.0),
+    # Keep everything 50 cm and above the camera.
+    "ceiling": (0.5, float("inf")),
+}
+
 CEILING_CLASS_IDX = 36
 MIRROR_CLASS_IDX = 85
 WALL_CLASS_IDX = 191
@@ -98,6 +113,28 @@ def rasterize_room_layout_pair(
     return img1, img2
 
 
+@functools.lru_cache(maxsize=4)
+def _get_layout_rasterization_constants(img_h: int, img_w: int, meters_per_px: float) -> Tuple[Sim2, int]:
+    """Compute (once per unique BEV configuration) the constants needed to rasterize a room layout.
+
+    The same BEV configuration is used across an entire dataset, so the world->image transform and line width
+    are computed once and shared by all subsequent calls, instead of being rebuilt for every rendered layout.
+
+    Args:
+        img_h: texture map height (in pixels).
+        img_w: texture map width (in pixels).
+        meters_per_px: resolution of the texture map.
+
+    Returns:
+        bevimg_Sim2_world: transformation that converts world points into bird's eye view image coordinates.
+        wdo_thickness_px: line thickness (in pixels) for rendering W/D/O polylines.
+    """
+    bevimg_Sim2_world = BEVParams(img_h=img_h, img_w=img_w, meters_per_px=meters_per_px).bevimg_Sim2_world
+    # Thickness will be 30 px at 2000 x 2000, and just 8 px at 500 x 500
+    wdo_thickness_px = bevparams.get_line_width_by_resolution(DEFAULT_METERS_PER_PX)
+    return bevimg_Sim2_world, wdo_thickness_px
+
+
 def rasterize_single_layout(
     bev_params: BEVParams, room_vertices: np.ndarray, wdo_objs: List[WDO], render_mask: bool = True
 ) -> np.ndarray:
@@ -114,7 +151,9 @@ def rasterize_single_layout(
         bev_img: array of shape (H,W,3) representing the rendered/rasterized BEV image.
     """
     HOHO_S_ZIND_SCALE_FACTOR = 1.5
-    bevimg_Sim2_world = bev_params.bevimg_Sim2_world
+    bevimg_Sim2_world, wdo_thickness_px = _get_layout_rasterization_constants(
+        bev_params.img_h, bev_params.img_w, bev_params.meters_per_px
+    )
 
     img_h = bev_params.img_h + 1
     img_w = bev_params.img_w + 1
@@ -123,8 +162,6 @@ def rasterize_single_layout(
 
     WHITE = (255, 255, 255)
 
-    # Thickness will be 30 px at 2000 x 2000, and just 8 px at 500 x 500
-    wdo_thickness_px = bevparams.get_line_width_by_resolution(DEFAULT_METERS_PER_PX)
     if render_mask:
         bev_img = rasterize_polygon(
             polygon_xy=room_vertices * HOHO_S_ZIND_SCALE_FACTOR,
@@ -251,6 +288,92 @@ def draw_polyline_cv2(
         image = cv2.line(image, (x1, y1), (x2, y2), color, thickness=thickness, lineType=cv2.LINE_AA)
 
 
+def write_rgb_image(fpath: str, img: np.ndarray) -> None:
+    """Encode an RGB image as JPEG and write it to disk, using OpenCV's encoder (which releases the GIL).
+
+    Args:
+        fpath: file path to write the image to.
+        img: array of shape (H,W,3) representing RGB image, with dtype uint8.
+    """
+    if img.dtype != np.uint8:
+        # OpenCV would otherwise silently saturate or rescale the values of other dtypes during JPEG encoding.
+        raise ValueError(f"Image to be written to {fpath} must have dtype uint8, but has dtype {img.dtype}")
+
+    is_success = cv2.imwrite(fpath, cv2.cvtColor(img, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, BEV_JPEG_QUALITY])
+    if not is_success:
+        raise RuntimeError(f"Image could not be written to {fpath}")
+
+
+def write_rgb_image_pair(fpath1: str, img1: np.ndarray, fpath2: str, img2: np.ndarray) -> None:
+    """Encode and write two RGB images concurrently (each in its own thread)."""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(write_rgb_image, fpath1, img1), executor.submit(write_rgb_image, fpath2, img2)]
+        for future in futures:
+            # Re-raise any exception from the writer thread.
+            future.result()
+
+
+class BackgroundImageWriter:
+    """Encodes and writes RGB images to disk in a background thread, so that rendering can proceed meanwhile.
+
+    At most `max_queue_size` images are held in memory; `write()` blocks when the queue is full. Should be used as
+    a context manager: all queued images have been written by the time the context exits, and an error raised by
+    any write is re-raised.
+    """
+
+    def __init__(self, max_queue_size: int = 8) -> None:
+        """Start the writer thread."""
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """Write queued images until the `None` sentinel is received."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                # Discard remaining images after a failure.
+                continue
+            fpath, img = item
+            try:
+                write_rgb_image(fpath, img)
+            except Exception as e:
+                self._error = e
+
+    def write(self, fpath: str, img: np.ndarray) -> None:
+        """Queue an RGB image (see `write_rgb_image()`) to be written. The array must not be modified afterwards."""
+        if self._error is not None:
+            raise self._error
+        self._queue.put((fpath, img))
+
+    def close(self) -> None:
+        """Wait until all queued images have been written, and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "BackgroundImageWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _write_rgb_image_pair(
+    fpath1: str, img1: np.ndarray, fpath2: str, img2: np.ndarray, image_writer: Optional[BackgroundImageWriter]
+) -> None:
+    """Write a pair of RGB images, either via a background writer (if provided), or immediately."""
+    if image_writer is None:
+        write_rgb_image_pair(fpath1, img1, fpath2, img2)
+        return
+    image_writer.write(fpath1, img1)
+    image_writer.write(fpath2, img2)
+
+
 def render_bev_image(bev_params: BEVParams, xyzrgb: np.ndarray, is_semantics: bool) -> Optional[np.ndarray]:
     """Given a colored point cloud, render it as a 2d texture map. Use sparse to dense interpolation.
 
@@ -261,7 +384,8 @@ def render_bev_image(bev_params: BEVParams, xyzrgb: np.ndarray, is_semantics: bo
         is_semantics: whether to treat RGB data as semantic data (nearest neighbor interpolation instead of linear)
 
     Returns:
-        bev_img: array of shape (H,W,3) representing a dense texture map
+        bev_img: array of shape (H,W,3) and dtype uint8 representing a dense texture map, or None if no points
+            fall within the rendered region.
     """
     xyz = xyzrgb[:, :3]
     rgb = xyzrgb[:, 3:] * 255
@@ -307,11 +431,9 @@ def render_bev_image(bev_params: BEVParams, xyzrgb: np.ndarray, is_semantics: bo
     sparse_bev_img = np.zeros((img_h, img_w, 3), dtype=np.uint8)
     sparse_bev_img[y, x] = rgb
 
-    interp_bev_img = np.zeros((img_h, img_w, 3), dtype=np.uint8)
-
-    # Now, apply interpolation to texture map.
+    # Now, apply interpolation to texture map (output buffer is allocated by the interpolation routine).
     interp_bev_img = interpolation_utils.interp_dense_grid_from_sparse(
-        interp_bev_img, img_xy, rgb, grid_h=img_h, grid_w=img_w, is_semantics=is_semantics
+        None, img_xy, rgb, grid_h=img_h, grid_w=img_w, is_semantics=is_semantics
     )
 
     # Apply filter to interpolated texture map, to remove hallucinated parts in all-black regions.
@@ -344,8 +466,41 @@ def grayscale_to_color(gray_img: np.ndarray) -> np.ndarray:
     return rgb_img
 
 
+def get_resize_interpolation(image: np.ndarray, h: int, w: int, is_semantics: bool) -> int:
+    """Choose the OpenCV interpolation method for resizing an image to (h,w).
+
+    Semantic label maps must use nearest-neighbor interpolation. For downsampling, area interpolation is the
+    appropriate (and a faster) kernel; for integer downsampling factors, e.g. 2048x1024 -> 1024x512, it
+    produces the same output as bilinear interpolation.
+    """
+    if is_semantics:
+        return cv2.INTER_NEAREST
+    if h < image.shape[0] or w < image.shape[1]:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
+
+
+def read_images(fpaths: List[str]) -> Dict[str, np.ndarray]:
+    """Decode images (e.g. panoramas and depth maps) from disk, keyed by file path.
+
+    Files that do not exist (yet) are skipped, and will instead be read by the consumer.
+    """
+    return {fpath: imageio.imread(fpath) for fpath in fpaths if os.path.exists(fpath)}
+
+
+def _read_image(fpath: str, preloaded: Optional[Dict[str, np.ndarray]]) -> np.ndarray:
+    """Return an image that was already decoded, if available, or otherwise read it from disk."""
+    if preloaded is not None and fpath in preloaded:
+        return preloaded[fpath]
+    return imageio.imread(fpath)
+
+
 def get_xyzrgb_from_depth(
-    args: Union[SimpleNamespace, Namespace], depth_fpath: str, rgb_fpath: str, is_semantics: bool
+    args: Union[SimpleNamespace, Namespace],
+    depth_fpath: str,
+    rgb_fpath: str,
+    is_semantics: bool,
+    preloaded: Optional[Dict[str, np.ndarray]] = None,
 ) -> np.ndarray:
     """Obtain colored point cloud by backprojecting panorama image RGB values using a depth map.
 
@@ -354,6 +509,8 @@ def get_xyzrgb_from_depth(
         depth_fpath: file path to depth map.
         rgb_fpath: file path to RGB panorama image.
         is_semantics: whether to interpret image as semantic label map.
+        preloaded: optional mapping from file path to already decoded image (see `read_images()`). Arrays
+            are not modified.
 
     Returns:
         xyzrgb: numpy array of shape (N,6), with rgb in [0,1] as floats.
@@ -364,15 +521,40 @@ def get_xyzrgb_from_depth(
     if "crop_z_range" not in args.__dict__:
         raise ValueError("Z-coordinate range for cropping must be provided as `args.crop_z_range`.")
 
-    depth = imageio.imread(depth_fpath)[..., None].astype(np.float32) * args.scale
+    xyzrgb = get_xyzrgb_from_depth_without_z_crop(args, depth_fpath, rgb_fpath, is_semantics, preloaded)
+
+    # Crop point cloud in 3d.
+    within_crop_range = get_z_crop_mask(xyzrgb[:, 2], crop_z_range=args.crop_z_range)
+    xyzrgb = xyzrgb[within_crop_range]
+    return xyzrgb
+
+
+def get_xyzrgb_from_depth_without_z_crop(
+    args: Union[SimpleNamespace, Namespace],
+    depth_fpath: str,
+    rgb_fpath: str,
+    is_semantics: bool,
+    preloaded: Optional[Dict[str, np.ndarray]] = None,
+) -> np.ndarray:
+    """Obtain colored point cloud by backprojecting panorama image RGB values using a depth map, at all heights.
+
+    Arguments match those of `get_xyzrgb_from_depth()`, except that `args.crop_z_range` is not used.
+
+    Returns:
+        xyzrgb: numpy array of shape (N,6), with rgb in [0,1] as floats.
+    """
+    if "crop_ratio" not in args.__dict__:
+        raise ValueError("Crop ratio for panorama top and bottom must be provided as `args.crop_ratio`.")
+
+    depth = _read_image(depth_fpath, preloaded)[..., None].astype(np.float32) * args.scale
 
     # Reading rgb-d
-    rgb = imageio.imread(rgb_fpath)
+    rgb = _read_image(rgb_fpath, preloaded)
 
     # Resize panorama from (2048,1024) to (1024, 512).
     width = 1024
     height = 512
-    rgb = cv2.resize(rgb, (width, height), interpolation=cv2.INTER_NEAREST if is_semantics else cv2.INTER_LINEAR)
+    rgb = cv2.resize(rgb, (width, height), interpolation=get_resize_interpolation(rgb, height, width, is_semantics))
 
     if is_semantics:
         # Remove ceiling and mirror points.
@@ -402,20 +584,41 @@ def get_xyzrgb_from_depth(
 
     # Flatten point cloud from (H,W,6) to (H*W,6).
     xyzrgb = xyzrgb.reshape(-1, 6)
-
-    # Crop point cloud in 3d.
-    # fmt: off
-    within_crop_range = np.logical_and(
-        xyzrgb[:, 2] > args.crop_z_range[0],
-        xyzrgb[:, 2] <= args.crop_z_range[1]
-    )
-    # fmt: on
-    xyzrgb = xyzrgb[within_crop_range]
     return xyzrgb
 
 
+def get_z_crop_mask(z: np.ndarray, crop_z_range: Tuple[float, float]) -> np.ndarray:
+    """Determine which points lie within the z-range (zmin,zmax] used for cropping a point cloud.
+
+    An infinite bound (e.g. for the floor, [-inf,-1.0]) is satisfied by any point, so only the comparison against
+    the finite bound is evaluated (NaN values are always excluded).
+
+    Args:
+        z: array of shape (N,) representing z-coordinates of points.
+        crop_z_range: lower (exclusive) and upper (inclusive) z-coordinate bounds.
+
+    Returns:
+        Boolean array of shape (N,), indicating which points fall within the range.
+    """
+    zmin, zmax = crop_z_range
+    if zmin == -np.inf and zmax == np.inf:
+        return ~np.isnan(z)
+    if zmin == -np.inf:
+        return z <= zmax
+    if zmax == np.inf:
+        return z > zmin
+    return np.logical_and(z > zmin, z <= zmax)
+
+
 def render_bev_pair(
-    args, building_id: str, floor_id: str, i1: int, i2: int, i2Ti1: Sim2, is_semantics: bool
+    args,
+    building_id: str,
+    floor_id: str,
+    i1: int,
+    i2: int,
+    i2Ti1: Sim2,
+    is_semantics: bool,
+    preloaded: Optional[Dict[str, np.ndarray]] = None,
 ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
     """Render a pair of texture maps in the same coordinate frame.
 
@@ -427,6 +630,7 @@ def render_bev_pair(
         i2: id of panorama 2.
         i2Ti1: relative pose between the two panoramas i1 and i2, such that p_i2 = i2Ti1 * p_i1.
         is_semantics:
+        preloaded: optional mapping from file path to already decoded panorama or depth map.
 
     Returns:
         img1: array of shape (H,W,3) representing BEV texture map rendering for pano 1,
@@ -434,8 +638,51 @@ def render_bev_pair(
         img2: array of shape (H,W,3) representing BEV texture map rendering for pano 2.
            Rendering is centered at pano 2's location.
     """
-    xyzrgb1 = get_xyzrgb_from_depth(args, depth_fpath=args.depth_i1, rgb_fpath=args.img_i1, is_semantics=is_semantics)
-    xyzrgb2 = get_xyzrgb_from_depth(args, depth_fpath=args.depth_i2, rgb_fpath=args.img_i2, is_semantics=is_semantics)
+    if "crop_z_range" not in args.__dict__:
+        raise ValueError("Z-coordinate range for cropping must be provided as `args.crop_z_range`.")
+
+    return render_bev_pair_for_z_ranges(
+        args, building_id, floor_id, i1, i2, i2Ti1, is_semantics, [args.crop_z_range], preloaded
+    )[0]
+
+
+def render_bev_pair_for_z_ranges(
+    args,
+    building_id: str,
+    floor_id: str,
+    i1: int,
+    i2: int,
+    i2Ti1: Sim2,
+    is_semantics: bool,
+    crop_z_ranges: List[Tuple[float, float]],
+    preloaded: Optional[Dict[str, np.ndarray]] = None,
+) -> List[Tuple[Optional[np.ndarray], Optional[np.ndarray]]]:
+    """Render a pair of texture maps in the same coordinate frame, for each of several z-ranges (e.g. floor, ceiling).
+
+    The panoramas are backprojected and transformed only once, and the resulting point clouds are then cropped
+    to each z-range separately. (`args.crop_z_range` is ignored.)
+
+    Args:
+        args:
+        building_id: unique ID of ZinD building.
+        floor_id: unique ID of floor of this ZinD building.
+        i1: id of panorama 1.
+        i2: id of panorama 2.
+        i2Ti1: relative pose between the two panoramas i1 and i2, such that p_i2 = i2Ti1 * p_i1.
+        is_semantics:
+        crop_z_ranges: z-coordinate ranges (zmin,zmax] to render.
+        preloaded: optional mapping from file path to already decoded panorama or depth map.
+
+    Returns:
+        List with one (img1, img2) tuple per z-range (see `render_bev_pair()`), where each image may be None if
+           no points fell within the rendered region.
+    """
+    xyzrgb1 = get_xyzrgb_from_depth_without_z_crop(
+        args, depth_fpath=args.depth_i1, rgb_fpath=args.img_i1, is_semantics=is_semantics, preloaded=preloaded
+    )
+    xyzrgb2 = get_xyzrgb_from_depth_without_z_crop(
+        args, depth_fpath=args.depth_i2, rgb_fpath=args.img_i2, is_semantics=is_semantics, preloaded=preloaded
+    )
 
     print(i2Ti1)
 
@@ -451,33 +698,31 @@ def render_bev_pair(
     xyzrgb1[:, :2] = (xyzrgb1[:, :2] @ i2Ti1.rotation.T) + (i2Ti1.translation * HOHO_S_ZIND_SCALE_FACTOR)
 
     bev_params = BEVParams()
-    img1 = render_bev_image(bev_params, xyzrgb1, is_semantics=is_semantics)
-    img2 = render_bev_image(bev_params, xyzrgb2, is_semantics=is_semantics)
+    bev_img_pairs = []
+    for crop_z_range in crop_z_ranges:
+        # Crop point clouds in 3d (the transformations above do not modify z-coordinates).
+        crop_xyzrgb1 = xyzrgb1[get_z_crop_mask(xyzrgb1[:, 2], crop_z_range=crop_z_range)]
+        crop_xyzrgb2 = xyzrgb2[get_z_crop_mask(xyzrgb2[:, 2], crop_z_range=crop_z_range)]
 
-    if img1 is None or img2 is None:
-        return None, None
+        img1 = render_bev_image(bev_params, crop_xyzrgb1, is_semantics=is_semantics)
+        img2 = render_bev_image(bev_params, crop_xyzrgb2, is_semantics=is_semantics)
 
-    visualize = False
-    if visualize:
-        # plt.scatter(xyzrgb1[:,0], xyzrgb1[:,1], 10, color='r', marker='.', alpha=0.1)
-        plt.scatter(xyzrgb1[:, 0], xyzrgb1[:, 1], 10, c=xyzrgb1[:, 3:], marker=".", alpha=0.1)
-        # plt.axis("equal")
-        # plt.show()
+        if img1 is None or img2 is None:
+            bev_img_pairs.append((None, None))
+            continue
 
-        # plt.scatter(xyzrgb2[:,0], xyzrgb2[:,1], 10, color='b', marker='.', alpha=0.1)
-        plt.scatter(xyzrgb2[:, 0], xyzrgb2[:, 1], 10, c=xyzrgb2[:, 3:], marker=".", alpha=0.1)
+        visualize = False
+        if visualize:
+            for crop_xyzrgb in [crop_xyzrgb1, crop_xyzrgb2]:
+                plt.scatter(crop_xyzrgb[:, 0], crop_xyzrgb[:, 1], 10, c=crop_xyzrgb[:, 3:], marker=".", alpha=0.1)
 
-        plt.title("")
-        plt.axis("equal")
-        plt.show()
-        # save_fpath = f"aligned_examples_2021_07_12/gt_aligned_approx/{building_id}/{floor_id}/{i1}_{i2}.jpg"
-        # os.makedirs(Path(save_fpath).parent, exist_ok=True)
-        # plt.savefig(save_fpath, dpi=1000)
-        # plt.close("all")
+            plt.title("")
+            plt.axis("equal")
+            plt.show()
 
-        # 30,35 on floor2 bug
+        bev_img_pairs.append((img1, img2))
 
-    return img1, img2
+    return bev_img_pairs
 
 
 def get_bev_pair_xyzrgb(
@@ -522,12 +767,161 @@ def get_bev_pair_xyzrgb(
     return xyzrgb1, xyzrgb2
 
 
-def generate_texture_maps_for_pair(
+def bev_fname_from_img_fpath(
+    pair_idx: int, pair_uuid: str, surface_type: str, img_fpath: str, is_semantics: bool
+) -> str:
+    """Generate file name for BEV texture map based on panorama image file path."""
+    modality = "semantics" if is_semantics else "rgb"
+    return f"pair_{pair_idx}___{pair_uuid}_{surface_type}_{modality}_{pano_stem(img_fpath)}.jpg"
+
+
+@functools.lru_cache(maxsize=None)
+def pano_stem(img_fpath: str) -> str:
+    """Return the file name of a panorama without its extension (memoized, as each panorama is part of many pairs)."""
+    return os.path.splitext(os.path.basename(img_fpath))[0]
+
+
+def depth_fpath_from_img_fpath(depth_save_root: str, building_id: str, img_fpath: str) -> str:
+    """Determine the file path of the depth map inferred for a panorama."""
+    return f"{depth_save_root}/{building_id}/{pano_stem(img_fpath)}.depth.png"
+
+
+def get_texture_map_input_fpaths(
+    img_fpaths_dict: Dict[int, str], pair_fpath: str, depth_save_root: str, building_id: str
+) -> List[str]:
+    """Return the file paths of the panoramas and depth maps that are read to render the texture maps of a pair."""
+    img_fpaths = [img_fpaths_dict[i] for i in panoids_from_pair_fpath(pair_fpath)]
+    return img_fpaths + [depth_fpath_from_img_fpath(depth_save_root, building_id, fpath) for fpath in img_fpaths]
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_pair_fpath(pair_fpath: str) -> Tuple[int, int, str]:
+    """Parse the file name of a pair's alignment hypothesis (memoized, as it is needed for each surface type).
+
+    For example, `5_8__door_0_0_rotated.json` corresponds to panoramas i1=5 and i2=8, with pair UUID
+    `door_0_0_rotated`.
+
+    Returns:
+        i1: ID of panorama 1.
+        i2: ID of panorama 2.
+        pair_uuid: identifier of the W/D/O pair and configuration used to generate the alignment hypothesis.
+    """
+    stem = os.path.splitext(os.path.basename(pair_fpath))[0]
+    i1, i2 = stem.split("_")[:2]
+    pair_uuid = stem.split("__")[-1]
+    return int(i1), int(i2), pair_uuid
+
+
+def panoids_from_pair_fpath(pair_fpath: str) -> Tuple[int, int]:
+    """Derive the IDs (i1,i2) of the two panoramas of a pair from the pair's alignment hypothesis file name."""
+    i1, i2, _ = parse_pair_fpath(pair_fpath)
+    return i1, i2
+
+
+def get_rendering_fpaths_for_pair(
+    img_fpaths_dict: Dict[int, str],
+    surface_type: str,
+    pair_fpath: str,
+    pair_idx: int,
+    label_type: str,
+    save_root: str,
+    building_id: str,
+    is_semantics: bool = False,
+) -> Tuple[str, str]:
+    """Determine the file paths where a pair of BEV renderings (texture maps or layouts) should be saved.
+
+    Args:
+        img_fpaths_dict: mapping from panorama index to panorama file path.
+        surface_type: type of surface to render (floor or ceiling).
+        pair_fpath: file path to a serialized .JSON file corresponding to Sim(2) relative pose hypothesis.
+        pair_idx: assigned index for the pair, among all pairs of this label type on the floor.
+        label_type: either "gt_alignment_approx" or "incorrect_alignment".
+        save_root: root directory for renderings of this modality (texture maps or layouts).
+        building_id: unique ID of ZInD building.
+        is_semantics: whether the rendering represents semantic labels, instead of RGB.
+
+    Returns:
+        fpath1: file path for the rendering of panorama i1.
+        fpath2: file path for the rendering of panorama i2.
+    """
+    # e.g. 'door_0_0_identity'
+    i1, i2, pair_uuid = parse_pair_fpath(pair_fpath)
+
+    save_dir = f"{save_root}/{label_type}/{building_id}"
+    fname1 = bev_fname_from_img_fpath(pair_idx, pair_uuid, surface_type, img_fpaths_dict[i1], is_semantics)
+    fname2 = bev_fname_from_img_fpath(pair_idx, pair_uuid, surface_type, img_fpaths_dict[i2], is_semantics)
+    return f"{save_dir}/{fname1}", f"{save_dir}/{fname2}"
+
+
+def make_rendering_dirs(
+    bev_save_root: str,
+    layout_save_root: Optional[str],
+    building_id: str,
+    label_types: List[str],
+    render_modalities: List[str],
+) -> None:
+    """Create the output directories for all renderings of a building, once, before rendering any pair.
+
+    Args:
+        bev_save_root: root directory for BEV texture maps.
+        layout_save_root: root directory for rasterized layouts.
+        building_id: unique ID of ZInD building.
+        label_types: label types of the pairs to render, e.g. "gt_alignment_approx" or "incorrect_alignment".
+        render_modalities: type of BEV rendering to generate (either "rgb_texture" or "layout", or both).
+    """
+    save_roots = []
+    if "rgb_texture" in render_modalities:
+        save_roots.append(bev_save_root)
+    if "layout" in render_modalities:
+        save_roots.append(layout_save_root)
+
+    for save_root in save_roots:
+        for label_type in label_types:
+            os.makedirs(f"{save_root}/{label_type}/{building_id}", exist_ok=True)
+
+
+def is_pair_rendered(
     img_fpaths_dict: Dict[int, str],
     surface_type: str,
     pair_fpath: str,
     pair_idx: int,
     label_type: str,
+    bev_save_root: str,
+    building_id: str,
+    render_modalities: List[str],
+    layout_save_root: Optional[str],
+) -> bool:
+    """Check whether all requested renderings for a single pair of panoramas already exist on disk.
+
+    Arguments match those of `generate_texture_maps_for_pair()`.
+
+    Returns:
+        Whether the pair can be skipped, since no rendering would be generated for it.
+    """
+    if "rgb_texture" in render_modalities:
+        bev_fpath1, bev_fpath2 = get_rendering_fpaths_for_pair(
+            img_fpaths_dict, surface_type, pair_fpath, pair_idx, label_type, bev_save_root, building_id
+        )
+        if not (Path(bev_fpath1).exists() and Path(bev_fpath2).exists()):
+            return False
+
+    # Layouts are only rasterized for the `floor` surface.
+    if "layout" in render_modalities and surface_type == "floor":
+        layout_fpath1, layout_fpath2 = get_rendering_fpaths_for_pair(
+            img_fpaths_dict, surface_type, pair_fpath, pair_idx, label_type, layout_save_root, building_id
+        )
+        if not (Path(layout_fpath1).exists() and Path(layout_fpath2).exists()):
+            return False
+
+    return True
+
+
+def generate_texture_maps_for_pair(
+    img_fpaths_dict: Dict[int, str],
+    surface_types: List[str],
+    pair_fpath: str,
+    pair_idx: int,
+    label_type: str,
     bev_save_root,
     building_id: str,
     floor_id: str,
@@ -535,12 +929,17 @@ def generate_texture_maps_for_pair(
     render_modalities: List[str],
     layout_save_root: str,
     floor_pose_graph: Optional[PoseGraph2d],
+    preloaded: Optional[Dict[str, np.ndarray]] = None,
+    image_writer: Optional[BackgroundImageWriter] = None,
 ) -> None:
-    """Generate and save a pair of texture maps for a single pair of panoramas.
+    """Generate and save texture maps for a single pair of panoramas, for one or more surface types.
+
+    The alignment hypothesis is parsed, and the panoramas and depth maps are decoded, only once per pair, and then
+    reused for each surface type. The output directories must already exist (see `make_rendering_dirs()`).
 
     Args:
         img_fpaths_dict: mapping from panorama index to panorama file path.
-        surface_type: type of surface to render (floor or ceiling).
+        surface_types: types of surface to render ("floor" and/or "ceiling").
         pair_fpath: file path to a serialized .JSON file corresponding to Sim(2) relative pose hypothesis.
         pair_idx: assigned index for ...
         label_type: 
@@ -551,49 +950,23 @@ def generate_texture_maps_for_pair(
         render_modalities: 
         layout_save_root: 
         floor_pose_graph: inferred or GT layout per each panorama (only used if layout will be rendered).
+        preloaded: optional mapping from file path to already decoded panorama or depth map, e.g. if prefetched
+            while the previous pair was being rendered. Images that are missing will be read from disk.
+        image_writer: optional background writer to hand the renderings to. If not provided, renderings are
+            written to disk before returning.
     """
     is_semantics = False
     # if is_semantics:
     #     crop_z_range = [-float('inf'), 2.0]
     # else:
 
-    if surface_type == "floor":
-        # Keep everything 1 meter and below the camera
-        crop_z_range = [-float("inf"), -1.0]
-
-    elif surface_type == "ceiling":
-        # Keep everything 50 cm and above the camera.
-        crop_z_range = [0.5, float("inf")]
-
     i2Ti1 = Sim2.from_json(json_fpath=pair_fpath)
 
-    i1, i2 = Path(pair_fpath).stem.split("_")[:2]
-    i1, i2 = int(i1), int(i2)
+    i1, i2 = panoids_from_pair_fpath(pair_fpath)
 
     img1_fpath = img_fpaths_dict[i1]
     img2_fpath = img_fpaths_dict[i2]
 
-    # e.g. 'door_0_0_identity'
-    pair_uuid = Path(pair_fpath).stem.split("__")[-1]
-
-    building_bev_save_dir = f"{bev_save_root}/{label_type}/{building_id}"
-    os.makedirs(building_bev_save_dir, exist_ok=True)
-
-    def bev_fname_from_img_fpath(pair_idx: int, pair_uuid: str, surface_type: str, img_fpath: str) -> None:
-        """Generate file name for BEV texture map based on panorama image file path."""
-        fname_stem = Path(img_fpath).stem
-        if is_semantics:
-            img_name = f"pair_{pair_idx}___{pair_uuid}_{surface_type}_semantics_{fname_stem}.jpg"
-        else:
-            img_name = f"pair_{pair_idx}___{pair_uuid}_{surface_type}_rgb_{fname_stem}.jpg"
-        return img_name
-
-    bev_fname1 = bev_fname_from_img_fpath(pair_idx, pair_uuid, surface_type, img1_fpath)
-    bev_fname2 = bev_fname_from_img_fpath(pair_idx, pair_uuid, surface_type, img2_fpath)
-
-    bev_fpath1 = f"{building_bev_save_dir}/{bev_fname1}"
-    bev_fpath2 = f"{building_bev_save_dir}/{bev_fname2}"
-
     if "rgb_texture" in render_modalities:
         print(f"On {i1},{i2}")
         hohonet_inference_utils.infer_depth_if_nonexistent(
@@ -602,68 +975,112 @@ def generate_texture_maps_for_pair(
         hohonet_inference_utils.infer_depth_if_nonexistent(
             depth_save_root=depth_save_root, building_id=building_id, img_fpath=img2_fpath
         )
-        args = SimpleNamespace(
-            **{
-                "img_i1": img1_fpath,
-                # "img_i1": semantic_img1_fpath if is_semantics else img1_fpath,
-                "img_i2": img2_fpath,
-                # "img_i2": semantic_img2_fpath if is_semantics else img2_fpath,
-                "depth_i1": f"{depth_save_root}/{building_id}/{Path(img1_fpath).stem}.depth.png",
-                "depth_i2": f"{depth_save_root}/{building_id}/{Path(img2_fpath).stem}.depth.png",
-                "scale": 0.001,
-                # Throw away top 80 and bottom 80 rows of pixel (too noisy of estimates in these regions).
-                "crop_ratio": 80 / 512,
-                "crop_z_range": crop_z_range,  # 0.3 # -1.0 # -0.5 # 0.3 # 1.2
-            }
-        )
-        # bev_img = bev_rendering_utils.vis_depth_and_render(args, is_semantics=False)
 
-        # print(f"img1: {img1_fpath}, img2: {img2_fpath}, surface_type: {surface_type}")
-        # print(f"bev_img1: {bev_fpath1}, bev_img2: {bev_fpath2}, surface_type: {surface_type}")
+        bev_fpaths_per_surface = {
+            surface_type: get_rendering_fpaths_for_pair(
+                img_fpaths_dict,
+                surface_type,
+                pair_fpath,
+                pair_idx,
+                label_type,
+                bev_save_root,
+                building_id,
+                is_semantics,
+            )
+            for surface_type in surface_types
+        }
+        _render_texture_map_pairs(
+            img1_fpath=img1_fpath,
+            img2_fpath=img2_fpath,
+            i2Ti1=i2Ti1,
+            i1=i1,
+            i2=i2,
+            bev_fpaths_per_surface=bev_fpaths_per_surface,
+            building_id=building_id,
+            floor_id=floor_id,
+            depth_save_root=depth_save_root,
+            preloaded=preloaded,
+            image_writer=image_writer,
+        )
 
-        if Path(bev_fpath1).exists() and Path(bev_fpath2).exists():
-            print("Both BEV images already exist, skipping...")
-            return
+    for surface_type in surface_types:
+        # Rasterized-layout rendering below (skipped if only generating texture maps).
+        # We only rasterize layout for `floor', not for `ceiling`.
+        # If `ceiling', we'll skip, since will be identical rendering to `floor`.
+        if "layout" not in render_modalities or surface_type != "floor":
+            continue
 
-        bev_img1, bev_img2 = render_bev_pair(
-            args, building_id, floor_id, i1, i2, i2Ti1, is_semantics=False
+        layout_fpath1, layout_fpath2 = get_rendering_fpaths_for_pair(
+            img_fpaths_dict, surface_type, pair_fpath, pair_idx, label_type, layout_save_root, building_id, is_semantics
         )
-        if bev_img1 is None or bev_img2 is None:
-            # print("skipping...")
-            return
-
-        imageio.imwrite(bev_fpath1, bev_img1)
-        imageio.imwrite(bev_fpath2, bev_img2)
 
-    if "layout" not in render_modalities:
-        return
+        if Path(layout_fpath1).exists() and Path(layout_fpath2).exists():
+            print("Both layout images already exist, skipping...")
+            continue
+
+        layoutimg1, layoutimg2 = rasterize_room_layout_pair(
+            i2Ti1=i2Ti1,
+            floor_pose_graph=floor_pose_graph,
+            building_id=building_id,
+            floor_id=floor_id,
+            i1=i1,
+            i2=i2,
+        )
+        _write_rgb_image_pair(layout_fpath1, layoutimg1, layout_fpath2, layoutimg2, image_writer)
 
-    # Rasterized-layout rendering below (skipped if only generating texture maps).
-    # We only rasterize layout for `floor', not for `ceiling`.
-    # If `ceiling', we'll skip, since will be identical rendering to `floor`.
-    if surface_type != "floor":
-        return
 
-    building_layout_save_dir = f"{layout_save_root}/{label_type}/{building_id}"
-    os.makedirs(building_layout_save_dir, exist_ok=True)
+def _render_texture_map_pairs(
+    img1_fpath: str,
+    img2_fpath: str,
+    i2Ti1: Sim2,
+    i1: int,
+    i2: int,
+    bev_fpaths_per_surface: Dict[str, Tuple[str, str]],
+    building_id: str,
+    floor_id: str,
+    depth_save_root: str,
+    preloaded: Optional[Dict[str, np.ndarray]],
+    image_writer: Optional[BackgroundImageWriter],
+) -> None:
+    """Render and save the BEV texture maps of a single pair of panoramas, for each surface type that is missing.
 
-    # Change to layout directory.
-    layout_fpath1 = f"{building_layout_save_dir}/{bev_fname1}"
-    layout_fpath2 = f"{building_layout_save_dir}/{bev_fname2}"
+    The panoramas are backprojected only once, for all surface types.
+    """
+    pending_surface_types = []
+    for surface_type, (bev_fpath1, bev_fpath2) in bev_fpaths_per_surface.items():
+        if Path(bev_fpath1).exists() and Path(bev_fpath2).exists():
+            print("Both BEV images already exist, skipping...")
+            continue
+        pending_surface_types.append(surface_type)
 
-    if Path(layout_fpath1).exists() and Path(layout_fpath2).exists():
-        print("Both layout images already exist, skipping...")
+    if len(pending_surface_types) == 0:
         return
 
-    # Skip for ceiling, since would be duplicate.
-    layoutimg1, layoutimg2 = rasterize_room_layout_pair(
-        i2Ti1=i2Ti1,
-        floor_pose_graph=floor_pose_graph,
-        building_id=building_id,
-        floor_id=floor_id,
-        i1=i1,
-        i2=i2,
+    args = SimpleNamespace(
+        **{
+            "img_i1": img1_fpath,
+            "img_i2": img2_fpath,
+            "depth_i1": depth_fpath_from_img_fpath(depth_save_root, building_id, img1_fpath),
+            "depth_i2": depth_fpath_from_img_fpath(depth_save_root, building_id, img2_fpath),
+            "scale": 0.001,
+            # Throw away top 80 and bottom 80 rows of pixel (too noisy of estimates in these regions).
+            "crop_ratio": 80 / 512,
+        }
+    )
+    bev_img_pairs = render_bev_pair_for_z_ranges(
+        args,
+        building_id,
+        floor_id,
+        i1,
+        i2,
+        i2Ti1,
+        is_semantics=False,
+        crop_z_ranges=[SURFACE_CROP_Z_RANGES[surface_type] for surface_type in pending_surface_types],
+        preloaded=preloaded,
     )
-    imageio.imwrite(layout_fpath1, layoutimg1)
-    imageio.imwrite(layout_fpath2, layoutimg2)
+    for surface_type, (bev_img1, bev_img2) in zip(pending_surface_types, bev_img_pairs):
+        if bev_img1 is None or bev_img2 is None:
+            continue
 
+        bev_fpath1, bev_fpath2 = bev_fpaths_per_surface[surface_type]
+        _write_rgb_image_pair(bev_fpath1, bev_img1, bev_fpath2, bev_img2, image_writer)
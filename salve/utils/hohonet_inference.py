@@ -3,6 +3,7 @@
 import os
 from pathlib import Path
 from types import SimpleNamespace
+from typing import List
 
 # refers to the HoHoNet repo
 from salve.utils.infer_depth import infer_depth
@@ -10,6 +11,9 @@ from salve.utils.infer_depth import infer_depth
 HOHONET_CONFIG_FPATH = "config/mp3d_depth/HOHO_depth_dct_efficienthc_TransEn1_hardnet.yaml"
 HOHONET_CKPT_FPATH = "ckpt/mp3d_depth_HOHO_depth_dct_efficienthc_TransEn1_hardnet/ep60.pth"
 
+# Number of panoramas fed to HoHoNet in a single forward pass, during batched inference.
+DEFAULT_DEPTH_INFERENCE_BATCH_SIZE = 8
+
 
 def infer_depth_if_nonexistent(depth_save_root: str, building_id: str, img_fpath: str) -> None:
     """Infer depth map if it does not already exist at `depth_save_root`."""
@@ -30,3 +34,41 @@ def infer_depth_if_nonexistent(depth_save_root: str, building_id: str, img_fpath
         }
     )
     infer_depth(args)
+
+
+def infer_depth_batch_if_nonexistent(
+    depth_save_root: str, building_id: str, img_fpaths: List[str], batch_size: int = DEFAULT_DEPTH_INFERENCE_BATCH_SIZE
+) -> None:
+    """Infer depth maps for all panoramas of a building whose depth maps do not already exist at `depth_save_root`.
+
+    Unlike `infer_depth_if_nonexistent()`, the model is loaded only once for all panoramas, and panoramas are
+    fed to the model in batches.
+
+    Args:
+        depth_save_root: directory where depth maps should be saved (or are already cached here).
+        building_id: unique ID of ZInD building.
+        img_fpaths: file paths of panoramas (from this building) to infer depth maps for.
+        batch_size: number of panoramas per forward pass.
+    """
+    building_depth_save_dir = f"{depth_save_root}/{building_id}"
+    missing_img_fpaths = [
+        img_fpath
+        for img_fpath in sorted(set(img_fpaths))
+        if not Path(f"{building_depth_save_dir}/{Path(img_fpath).stem}.depth.png").exists()
+    ]
+    if len(missing_img_fpaths) == 0:
+        return
+
+    os.makedirs(building_depth_save_dir, exist_ok=True)
+
+    args = SimpleNamespace(
+        **{
+            "cfg": HOHONET_CONFIG_FPATH,
+            "pth": HOHONET_CKPT_FPATH,
+            "out": building_depth_save_dir,
+            "inp": missing_img_fpaths,
+            "batch_size": batch_size,
+            "opts": [],
+        }
+    )
+    infer_depth(args)
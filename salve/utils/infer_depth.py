@@ -25,17 +25,32 @@ except Exception as e:
     print("Exception: ", e)
 
 
+def load_pano_as_tensor(path: str) -> torch.Tensor:
+    """Load a panorama as a (1,3,H,W) float tensor in [0,1], resized to the model's expected input resolution."""
+    rgb = imread(path)
+    x = torch.from_numpy(rgb).permute(2, 0, 1)[None].float() / 255.0
+    if x.shape[2:] != config.dataset.common_kwargs.hw:
+        x = torch.nn.functional.interpolate(x, config.dataset.common_kwargs.hw, mode="area")
+    return x
+
+
 def infer_depth(args: Union[SimpleNamespace, argparse.Namespace]) -> None:
-    """Infer monocular depth map and write as PNG to disk."""
+    """Infer monocular depth map and write as PNG to disk.
+
+    `args.inp` may either be a glob pattern, or a list of image file paths. If `args.batch_size` is provided,
+    panoramas are fed to the network in batches of that size (default 1).
+    """
     update_config(config, args)
     device = "cuda" if config.cuda and torch.cuda.is_available() else "cpu"
 
     # Parse input paths
-    rgb_lst = glob.glob(args.inp)
+    rgb_lst = glob.glob(args.inp) if isinstance(args.inp, str) else list(args.inp)
     if len(rgb_lst) == 0:
         print("No images found")
         sys.exit()
 
+    batch_size = getattr(args, "batch_size", 1)
+
     # Init model
     model_file = importlib.import_module(config.model.file)
     model_class = getattr(model_file, config.model.modelclass)
@@ -45,28 +60,27 @@ def infer_depth(args: Union[SimpleNamespace, argparse.Namespace]) -> None:
 
     # Run inference
     with torch.no_grad():
-        for path in tqdm(rgb_lst):
-            rgb = imread(path)
-            x = torch.from_numpy(rgb).permute(2, 0, 1)[None].float() / 255.0
-            if x.shape[2:] != config.dataset.common_kwargs.hw:
-                x = torch.nn.functional.interpolate(x, config.dataset.common_kwargs.hw, mode="area")
+        for batch_start in tqdm(range(0, len(rgb_lst), batch_size)):
+            batch_paths = rgb_lst[batch_start : batch_start + batch_size]
+            x = torch.cat([load_pano_as_tensor(path) for path in batch_paths], dim=0)
             x = x.to(device)
             pred_depth = net.infer(x)
             if not torch.is_tensor(pred_depth):
                 pred_depth = pred_depth.pop("depth")
 
-            fname = os.path.splitext(os.path.split(path)[1])[0]
-            imwrite(
-                os.path.join(args.out, f"{fname}.depth.png"),
-                pred_depth.mul(1000).squeeze().cpu().numpy().astype(np.uint16),
-            )
+            for path, pred_depth_single in zip(batch_paths, pred_depth):
+                fname = os.path.splitext(os.path.split(path)[1])[0]
+                imwrite(
+                    os.path.join(args.out, f"{fname}.depth.png"),
+                    pred_depth_single.mul(1000).squeeze().cpu().numpy().astype(np.uint16),
+                )
 
-            visualize = False
-            if visualize:
-                import matplotlib.pyplot as plt
+                visualize = False
+                if visualize:
+                    import matplotlib.pyplot as plt
 
-                plt.imshow(pred_depth.mul(1000).squeeze().cpu().numpy().astype(np.uint16))
-                plt.show()
+                    plt.imshow(pred_depth_single.mul(1000).squeeze().cpu().numpy().astype(np.uint16))
+                    plt.show()
 
 
 if __name__ == "__main__":
@@ -4,6 +4,8 @@ Utilities are also included for removing interpolation artifacts. Interpolation
 there was no signal.
 """
 
+from typing import Optional
+
 import numpy as np
 import scipy.interpolate  # not quite the same as `matplotlib.mlab.griddata`
 import torch
@@ -19,11 +21,17 @@ MIN_REQUIRED_POINTS_SIMPLEX = 4
 
 
 def interp_dense_grid_from_sparse(
-    bev_img: np.ndarray, points: np.ndarray, rgb_values: np.ndarray, grid_h: int, grid_w: int, is_semantics: bool
+    bev_img: Optional[np.ndarray],
+    points: np.ndarray,
+    rgb_values: np.ndarray,
+    grid_h: int,
+    grid_w: int,
+    is_semantics: bool,
 ) -> np.ndarray:
     """
     Args:
-        bev_img: dense grid of shape (grid_h, grid_w, 3) to be populated with interpolated values
+        bev_img: dense grid of shape (grid_h, grid_w, 3) to be populated with interpolated values. If None,
+            an output grid of dtype uint8 will be allocated (zero-filled only if interpolation is impossible).
         points: (N,2) or (N,3) array of (x,y,z) or (x,y) coordinates
         rgb_values:
         grid_h: grid height (in pixels).
@@ -34,11 +42,10 @@ def interp_dense_grid_from_sparse(
     Returns:
         bev_img: dense grid of shape (grid_h, grid_w, 3) populated with interpolated values
     """
-    if points.shape[0] < MIN_REQUIRED_POINTS_SIMPLEX:
+    if points.shape[0] < MIN_REQUIRED_POINTS_SIMPLEX or is_collinear(points):
         # return the empty grid, since we can't interpolate.
-        return bev_img
-
-    if is_collinear(points):
+        if bev_img is None:
+            bev_img = np.zeros((grid_h, grid_w, 3), dtype=np.uint8)
         return bev_img
 
     grid_coords = get_mesh_grid_as_point_cloud(min_x=0, max_x=grid_w - 1, min_y=0, max_y=grid_h - 1)
@@ -49,11 +56,11 @@ def interp_dense_grid_from_sparse(
     # import pdb; pdb.set_trace()
     interp_rgb_vals[np.isnan(interp_rgb_vals)] = 0
 
-    # can swap axes arbitrarily
-    Y = grid_coords[:, 1].astype(np.int32)
-    X = grid_coords[:, 0].astype(np.int32)
-    # print(np.isnan(interp_rgb_vals).all())
-    bev_img[Y, X, :] = interp_rgb_vals
+    # The mesh grid enumerates every grid cell in row-major (y, then x) order, so every cell is overwritten below,
+    # and no zero-initialization of the output is required.
+    if bev_img is None:
+        bev_img = np.empty((grid_h, grid_w, 3), dtype=np.uint8)
+    bev_img[:, :, :] = interp_rgb_vals.reshape(grid_h, grid_w, -1)
     return bev_img
 
 
@@ -115,12 +122,10 @@ def remove_hallucinated_content(
         counts = counts.cpu()
 
     mask = counts > 0
-    mask = mask.numpy().reshape(H, W).astype(np.float32)
-
-    # CHW -> HWC
-    mask = np.tile(mask, (3, 1, 1)).transpose(1, 2, 0)
+    mask = mask.numpy().reshape(H, W)
 
-    # Multiply interpolated image with binary unreliability mask to zero-out unreliable values.
-    unhalluc_img = (mask * interp_bev_img).astype(np.uint8)
+    # Zero-out unreliable values by selecting with the binary mask (broadcast over channels), instead of
+    # multiplying with a tiled float32 copy of the mask.
+    unhalluc_img = np.where(mask[:, :, np.newaxis], interp_bev_img, 0).astype(np.uint8)
     return unhalluc_img
 
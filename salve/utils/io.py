@@ -5,6 +5,12 @@ import os
 from pathlib import Path
 from typing import Any, Dict, List, Union
 
+try:
+    # Optional, much faster JSON parser. Falls back to the standard library if unavailable.
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def read_json_file(fpath: Union[str, Path]) -> Any:
     """Load dictionary from JSON file.
@@ -15,11 +21,15 @@ def read_json_file(fpath: Union[str, Path]) -> Any:
     Returns:
         Deserialized Python dictionary or list.
     """
-    if not Path(fpath).exists():
-        raise FileNotFoundError(f"No file found at {fpath}")
+    try:
+        # Read the raw bytes once, rather than checking for the file's existence first.
+        json_bytes = Path(fpath).read_bytes()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No file found at {fpath}") from None
 
-    with open(fpath, "r") as f:
-        return json.load(f)
+    if orjson is not None:
+        return orjson.loads(json_bytes)
+    return json.loads(json_bytes)
 
 def save_json_file(
     json_fpath: str,
@@ -2,8 +2,6 @@
 
 import numpy as np
 
-from salve.utils.mesh_grid import get_mesh_grid_as_point_cloud
-
 DUMMY_VAL = np.iinfo(np.uint64).max
 
 
@@ -32,51 +30,28 @@ def choose_elevated_repeated_vals(
        valid: logicals indicating whether whether highest z value at each location.
     """
     num_pts = x.shape[0]
-    global_idxs = np.arange(num_pts)
-
-    # Find min x, max x.
-    xmin, xmax = 0, x.max()
-    # Find min y, max y.
-    ymin, ymax = 0, y.max()
-
-    img_h = ymax - ymin + 1
-    img_w = xmax - xmin + 1
 
-    # Make 2d grid, fill it up with dummy values.
-    img = np.ones((img_h, img_w), dtype=np.uint64) * DUMMY_VAL
+    # Find max x, max y (min x and min y are 0).
+    img_h = y.max() + 1
+    img_w = x.max() + 1
 
-    # Only bottom to top is supported currently.
+    # Assign each point to its z-slice, i.e. bin k for z in [z_planes[k], z_planes[k+1]). Points outside of
+    # [zmin,zmax), or with NaN z values, fall outside the valid bins and are discarded.
     z_planes = np.linspace(zmin, zmax, num_slices + 1)
+    slice_idxs = np.digitize(z, z_planes) - 1
+    in_range_idxs = np.where((slice_idxs >= 0) & (slice_idxs < num_slices))[0]
 
-    # z_plane_indices = np.digitize(z, z_planes)
-
-    for z_plane_idx in range(len(z_planes) - 1):
-
-        z_start = z_planes[z_plane_idx]
-        z_end = z_planes[z_plane_idx + 1]
-
-        # within the slice
-        ws = np.logical_and(z >= z_start, z < z_end)
-        x_ws = x[ws]
-        y_ws = y[ws]
-        idxs_ws = global_idxs[ws]
-
-        # Place into the grid, the global index of the point.
-        img[y_ws, x_ws] = idxs_ws
-
-    # Use np.meshgrid to index into array.
-    pts = get_mesh_grid_as_point_cloud(xmin, xmax, ymin, ymax)
-    pts = np.round(pts).astype(np.uint64)
-
-    idxs = img[pts[:, 1], pts[:, 0]]
+    # Only bottom to top is supported currently. Instead of placing one z-slice into the grid at a time, we place
+    # all points at once, ordered by z-slice. A stable sort keeps the original point order within each slice, so
+    # that later points (and points in higher slices) overwrite earlier ones, as with slice-by-slice placement.
+    order = in_range_idxs[np.argsort(slice_idxs[in_range_idxs].astype(np.int16), kind="stable")]
 
-    # Throw away all indices where they are dummy values.
-    is_valid = np.where(idxs != DUMMY_VAL)[0]
+    # Make 2d grid, fill it up with dummy values, and place into the grid the global index of each point.
+    img = np.full((img_h, img_w), DUMMY_VAL, dtype=np.uint64)
+    img[y[order], x[order]] = order
 
-    # Get back 2d coordinates that are not fully of dummy values.
-    # Look up the global point index, for those 2d coordinates.
-    valid_coords = pts[is_valid]
-    global_idxs = img[valid_coords[:, 1], valid_coords[:, 0]]
+    # Every grid cell that does not hold a dummy value holds the index of the most elevated point at that location.
+    global_idxs = img[img != DUMMY_VAL]
 
     is_valid_ = np.zeros(num_pts, dtype=bool)
     is_valid_[global_idxs] = 1
@@ -1,31 +1,62 @@
 """Script to query completion progress of texture-map rendering during execution."""
 
-import glob
-from pathlib import Path
+import os
 
 import click
 
 EPS = 1e-10
 
 
+def count_dir_entries(dirpath: str) -> int:
+    """Count the (non-hidden) entries in a directory, without stat'ing each one.
+
+    Args:
+        dirpath: path to directory.
+
+    Returns:
+        Number of entries in the directory, or 0 if the directory does not exist.
+    """
+    try:
+        with os.scandir(dirpath) as it:
+            return sum(1 for entry in it if not entry.name.startswith("."))
+    except FileNotFoundError:
+        return 0
+
+
+def count_hypotheses_for_building(hypotheses_save_root: str, building_id: str, label_type: str) -> int:
+    """Count the number of alignment hypotheses of a given label type, summed over all floors of a building.
+
+    Args:
+        hypotheses_save_root: path to generated alignment hypotheses.
+        building_id: unique ID of ZInD building.
+        label_type: either "gt_alignment_approx" or "incorrect_alignment".
+
+    Returns:
+        Total number of hypothesis files found under `{hypotheses_save_root}/{building_id}/*/{label_type}`.
+    """
+    try:
+        with os.scandir(f"{hypotheses_save_root}/{building_id}") as it:
+            floor_dirpaths = [entry.path for entry in it if entry.is_dir() and not entry.name.startswith(".")]
+    except FileNotFoundError:
+        return 0
+    return sum(count_dir_entries(f"{floor_dirpath}/{label_type}") for floor_dirpath in floor_dirpaths)
+
+
 def query_completion_progress(hypotheses_save_root: str, bev_save_root: str) -> None:
     """Logs to stdout the current rendering completion percent for each ZInD building."""
-    building_ids = [Path(d).name for d in glob.glob(f"{bev_save_root}/gt_alignment_approx/*")]
-    building_ids.sort()
+    building_ids = sorted(d for d in os.listdir(f"{bev_save_root}/gt_alignment_approx") if not d.startswith("."))
     for building_id in building_ids:
 
         # Count number of expected positives and number of currently rendered positives (match pairs).
-        pos_hypotheses_dirpath = f"{hypotheses_save_root}/{building_id}/*/gt_alignment_approx"
         positive_render_dirpath = f"{bev_save_root}/gt_alignment_approx/{building_id}"
-        num_rendered_positives = len(glob.glob(f"{positive_render_dirpath}/*")) / 4
-        expected_num_positives = len(glob.glob(f"{pos_hypotheses_dirpath}/*"))
+        num_rendered_positives = count_dir_entries(positive_render_dirpath) / 4
+        expected_num_positives = count_hypotheses_for_building(hypotheses_save_root, building_id, "gt_alignment_approx")
         pos_rendering_percent = num_rendered_positives / (expected_num_positives + EPS) * 100
 
         # Count number of expected negatives and number of currently rendered negatives (mismatched pairs).
-        neg_hypotheses_dirpath = f"{hypotheses_save_root}/{building_id}/*/incorrect_alignment"
         negative_render_dirpath = f"{bev_save_root}/incorrect_alignment/{building_id}"
-        num_rendered_negatives = len(glob.glob(f"{negative_render_dirpath}/*")) / 4
-        expected_num_negatives = len(glob.glob(f"{neg_hypotheses_dirpath}/*"))
+        num_rendered_negatives = count_dir_entries(negative_render_dirpath) / 4
+        expected_num_negatives = count_hypotheses_for_building(hypotheses_save_root, building_id, "incorrect_alignment")
         neg_rendering_percent = num_rendered_negatives / (expected_num_negatives + EPS) * 100
 
         print(f"Building {building_id} Pos. {pos_rendering_percent:.2f}% Neg. {neg_rendering_percent:.2f}%")
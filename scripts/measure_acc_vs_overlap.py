@@ -2,7 +2,7 @@
 
 import glob
 import os
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
 import click
 import imageio
@@ -79,8 +79,12 @@ def measure_acc_vs_visual_overlap(
             f2 = imageio.imread(fp1)
             floor_iou = iou_utils.texture_map_iou(f1, f2)
 
-            i1 = int(Path(fp0).stem.split("_")[-1])
-            i2 = int(Path(fp1).stem.split("_")[-1])
+            # Only string parsing is needed, so build one lightweight pure path per file, instead of a `Path` per field.
+            fp0_path = PurePosixPath(fp0)
+            stem0 = fp0_path.stem
+
+            i1 = int(stem0.split("_")[-1])
+            i2 = int(PurePosixPath(fp1).stem.split("_")[-1])
 
             if i1 >= i2:
                 temp_i2 = i1
@@ -89,23 +93,24 @@ def measure_acc_vs_visual_overlap(
                 i1 = temp_i1
                 i2 = temp_i2
 
-            building_id = Path(fp0).parent.stem
+            building_id = fp0_path.parent.stem
 
-            s = Path(fp0).stem.find("floor_0")
-            e = Path(fp0).stem.find("_partial")
-            floor_id = Path(fp0).stem[s:e]
+            s = stem0.find("floor_0")
+            e = stem0.find("_partial")
+            floor_id = stem0[s:e]
 
-            pair_idx = Path(fp0).stem.split("_")[1]
+            pair_idx = stem0.split("_")[1]
 
-            is_identity = "identity" in Path(fp0).stem
+            is_identity = "identity" in stem0
             configuration = "identity" if is_identity else "rotated"
 
             # Rip out the WDO indices (`wdo_pair_uuid`),
             # given a filename of the form `pair_3905___door_3_0_identity_floor_rgb_floor_01_partial_room_02_pano_38.jpg`
-            k = Path(fp0).stem.split("___")[1].find(f"_{configuration}")
+            wdo_pair_stem = stem0.split("___")[1]
+            k = wdo_pair_stem.find(f"_{configuration}")
             assert k != -1
-            wdo_pair_uuid = Path(fp0).stem.split("___")[1][:k]
-            assert any([wdo_type in wdo_pair_uuid for wdo_type in ["door", "window", "opening"]])
+            wdo_pair_uuid = wdo_pair_stem[:k]
+            assert "door" in wdo_pair_uuid or "window" in wdo_pair_uuid or "opening" in wdo_pair_uuid
 
             m = EdgeClassification(
                 i1=i1,
@@ -5,22 +5,25 @@ with a pre-trained model.
 
 The rendering can be parallelized if `num_processes` is set to >1. There are two options -- either
 each process renders BEV texture maps for individual homes, or each process renders BEV texture maps
-for different panorama pairs for a **single home**.
+for different panorama pairs for a **single home**. Missing depth maps are always inferred beforehand, in
+the main process (on the GPU, if available), so that the rendering processes only require the CPU.
 """
 
-import glob
 import os
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Pool
 from pathlib import Path
 from types import SimpleNamespace
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import click
 import imageio
+from tqdm import tqdm
 
 import salve.common.posegraph2d as posegraph2d
 import salve.dataset.hnet_prediction_loader as hnet_prediction_loader
 import salve.utils.bev_rendering_utils as bev_rendering_utils
+import salve.utils.hohonet_inference as hohonet_inference_utils
 from salve.common.sim2 import Sim2
 from salve.dataset.zind_partition import DATASET_SPLITS
 from salve.common.posegraph2d import PoseGraph2d
@@ -31,15 +34,128 @@ def panoid_from_fpath(fpath: str) -> int:
     return int(Path(fpath).stem.split("_")[-1])
 
 
+def list_files_with_suffix(dirpath: str, suffix: str) -> List[str]:
+    """List the paths of (non-hidden) files within a directory that end with a given suffix, e.g. ".json".
+
+    A single `os.scandir()` pass is used (instead of `glob.glob()`), which avoids extra metadata calls on
+    network file systems. If the directory does not exist, an empty list is returned.
+    """
+    try:
+        with os.scandir(dirpath) as it:
+            return [entry.path for entry in it if entry.name.endswith(suffix) and not entry.name.startswith(".")]
+    except FileNotFoundError:
+        return []
+
+
+# Keyword arguments shared by all tasks of a pool, set once per worker process by `_init_worker()`.
+_WORKER_SHARED_KWARGS: Dict[str, Any] = {}
+
+
+def _init_worker(shared_kwargs: Dict[str, Any]) -> None:
+    """Store the keyword arguments that are shared by all tasks, once per worker process."""
+    global _WORKER_SHARED_KWARGS
+    _WORKER_SHARED_KWARGS = shared_kwargs
+
+
+def _call_with_kwargs(func_and_kwargs: Tuple[Callable, Dict[str, Any]]) -> None:
+    """Call a function with task-specific and shared keyword arguments (`Pool.imap_unordered` passes a single one)."""
+    func, kwargs = func_and_kwargs
+    func(**kwargs, **_WORKER_SHARED_KWARGS)
+
+
+def run_tasks(
+    func: Callable, kwargs: List[Dict[str, Any]], num_processes: int, shared_kwargs: Optional[Dict[str, Any]] = None
+) -> None:
+    """Execute `func` once per task, across a pool of worker processes (or serially if only one).
+
+    Tasks are handed out one at a time, in order, as workers become available (instead of in large contiguous
+    slices, as `Pool.starmap` does), so that a few expensive tasks do not leave the other workers idle.
+
+    Arguments that are identical for all tasks are sent to each worker process only once (via the pool's
+    initializer), instead of being pickled again for every task.
+
+    Args:
+        func: function to execute.
+        kwargs: list of task-specific keyword arguments for each call to `func`.
+        num_processes: number of worker processes to use.
+        shared_kwargs: keyword arguments that are passed to every call to `func`.
+    """
+    if shared_kwargs is None:
+        shared_kwargs = {}
+
+    if num_processes > 1:
+        with Pool(num_processes, initializer=_init_worker, initargs=(shared_kwargs,)) as p:
+            tasks = [(func, single_call_kwargs) for single_call_kwargs in kwargs]
+            for _ in tqdm(p.imap_unordered(_call_with_kwargs, tasks, chunksize=1), total=len(tasks)):
+                pass
+    else:
+        for single_call_kwargs in kwargs:
+            func(**single_call_kwargs, **shared_kwargs)
+
+
+def get_pending_floor_pairs(
+    bev_save_root: str,
+    hypotheses_save_root: str,
+    building_id: str,
+    floor_id: str,
+    img_fpaths_dict: Dict[int, str],
+    layout_save_root: Optional[str],
+    render_modalities: List[str],
+) -> List[Tuple[str, int, str, List[str]]]:
+    """Find the alignment hypotheses of a single floor that still need to be rendered.
+
+    Args:
+        bev_save_root: directory where bird's eye view texture maps should be saved.
+        hypotheses_save_root: directory where putative alignment hypotheses are saved.
+        building_id: unique ID of ZInD building.
+        floor_id: unique ID of floor.
+        img_fpaths_dict: mapping from panorama index to panorama file path, for this building.
+        layout_save_root: if rendering rasterized layout, all images will be saved under this directory.
+        render_modalities: type of BEV rendering to generate (either "rgb_texture" or "layout", or both).
+
+    Returns:
+        pending_pairs: list of (label_type, pair_idx, pair_fpath, surface_types) tuples, one per pair with
+            renderings that do not exist on disk yet, where `surface_types` lists the surfaces left to render.
+    """
+    floor_labels_dirpath = f"{hypotheses_save_root}/{building_id}/{floor_id}"
+
+    pending_pairs = []
+    for label_type in ["gt_alignment_approx", "incorrect_alignment"]:  # "gt_alignment_exact"
+        pairs = list_files_with_suffix(f"{floor_labels_dirpath}/{label_type}", ".json")
+        pairs.sort()
+
+        for pair_idx, pair_fpath in enumerate(pairs):
+            surface_types = [
+                surface_type
+                for surface_type in ["floor", "ceiling"]
+                if not bev_rendering_utils.is_pair_rendered(
+                    img_fpaths_dict=img_fpaths_dict,
+                    surface_type=surface_type,
+                    pair_fpath=pair_fpath,
+                    pair_idx=pair_idx,
+                    label_type=label_type,
+                    bev_save_root=bev_save_root,
+                    building_id=building_id,
+                    render_modalities=render_modalities,
+                    layout_save_root=layout_save_root,
+                )
+            ]
+            if len(surface_types) > 0:
+                pending_pairs.append((label_type, pair_idx, pair_fpath, surface_types))
+
+    return pending_pairs
+
+
 def render_building_floor_pairs(
     depth_save_root: str,
     bev_save_root: str,
-    hypotheses_save_root: str,
-    raw_dataset_dir: str,
     building_id: str,
     floor_id: str,
+    img_fpaths_dict: Dict[int, str],
+    pending_pairs: List[Tuple[str, int, str, List[str]]],
     layout_save_root: Optional[str],
     render_modalities: List[str],
+    floor_pose_graph: Optional[PoseGraph2d],
     multiprocess_building_panos: bool,
     num_processes: int,
 ) -> None:
@@ -50,71 +166,189 @@ def render_building_floor_pairs(
     Args:
         depth_save_root: directory where depth maps should be saved (or are already cached here).
         bev_save_root: directory where bird's eye view texture maps should be saved.
-        hypotheses_save_root: directory where putative alignment hypotheses are saved.
-        raw_dataset_dir: path to ZInD dataset.
         building_id: unique ID of ZInD building.
         floor_id: unique ID of floor.
+        img_fpaths_dict: mapping from panorama index to panorama file path, for this building.
+        pending_pairs: (label_type, pair_idx, pair_fpath, surface_types) tuples to render, as returned by
+            `get_pending_floor_pairs()`.
         layout_save_root: if rendering rasterized layout, all images will be saved under this directory.
         render_modalities: type of BEV rendering to generate (either "rgb_texture" or "layout", or both).
+        floor_pose_graph: inferred or GT layout per each panorama (only used if layout will be rendered).
         multiprocess_building_panos: Whether to apply multiprocessing within a single building (i.e. multiprocess
             the pano pairs for a single building when True), or instead across buildings (one process per building
             when False).
         num_processes: number of processes to use for rendering pairs from this building.
     """
-    if "layout" in render_modalities:
-        # Load the layouts that we will render (either inferred or GT layout).
-        use_inferred_wdos_layout = True
-        if use_inferred_wdos_layout:
-            floor_pose_graphs = hnet_prediction_loader.load_inferred_floor_pose_graphs(
-                building_id=building_id, raw_dataset_dir=raw_dataset_dir
+    print(f"On Building {building_id}, {floor_id}: {len(pending_pairs)} pending renderings")
+
+    kwargs = [
+        {"surface_types": surface_types, "pair_fpath": pair_fpath, "pair_idx": pair_idx, "label_type": label_type}
+        for label_type, pair_idx, pair_fpath, surface_types in pending_pairs
+    ]
+    shared_kwargs = {
+        "img_fpaths_dict": img_fpaths_dict,
+        "bev_save_root": bev_save_root,
+        "building_id": building_id,
+        "floor_id": floor_id,
+        "depth_save_root": depth_save_root,
+        "render_modalities": render_modalities,
+        "layout_save_root": layout_save_root,
+        "floor_pose_graph": floor_pose_graph,
+    }
+
+    if multiprocess_building_panos and num_processes > 1:
+        run_tasks(
+            func=bev_rendering_utils.generate_texture_maps_for_pair,
+            kwargs=kwargs,
+            num_processes=num_processes,
+            shared_kwargs=shared_kwargs,
+        )
+        return
+
+    if "rgb_texture" not in render_modalities:
+        run_tasks(
+            func=bev_rendering_utils.generate_texture_maps_for_pair,
+            kwargs=kwargs,
+            num_processes=1,
+            shared_kwargs=shared_kwargs,
+        )
+        return
+
+    input_fpaths = [
+        bev_rendering_utils.get_texture_map_input_fpaths(img_fpaths_dict, pair_fpath, depth_save_root, building_id)
+        for _, _, pair_fpath, _ in pending_pairs
+    ]
+    render_pairs_with_prefetch(kwargs=kwargs, shared_kwargs=shared_kwargs, input_fpaths=input_fpaths)
+
+
+def render_pairs_with_prefetch(
+    kwargs: List[Dict[str, Any]], shared_kwargs: Dict[str, Any], input_fpaths: List[List[str]]
+) -> None:
+    """Render pairs sequentially, while decoding the panoramas and depth maps of the next pair in a background thread.
+
+    Overlapping the (blocking) image reads with rendering of the current pair hides most of the disk latency.
+    Similarly, renderings are encoded and written to disk by a background writer thread.
+
+    Args:
+        kwargs: list of pair-specific keyword arguments for each call to `generate_texture_maps_for_pair()`.
+        shared_kwargs: keyword arguments that are passed to every call to `generate_texture_maps_for_pair()`.
+        input_fpaths: for each call, the file paths of the images to decode ahead of time.
+    """
+    if len(kwargs) == 0:
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as executor, bev_rendering_utils.BackgroundImageWriter() as image_writer:
+        next_images = executor.submit(bev_rendering_utils.read_images, input_fpaths[0])
+        for k, single_call_kwargs in enumerate(kwargs):
+            images = next_images.result()
+            if k + 1 < len(kwargs):
+                next_images = executor.submit(bev_rendering_utils.read_images, input_fpaths[k + 1])
+            bev_rendering_utils.generate_texture_maps_for_pair(
+                **single_call_kwargs, **shared_kwargs, preloaded=images, image_writer=image_writer
             )
-            if floor_pose_graphs is None:
-                return
-            floor_pose_graph = floor_pose_graphs[floor_id]
-        else:
-            floor_pose_graph = posegraph2d.get_gt_pose_graph(building_id, floor_id, raw_dataset_dir)
-    else:
-        floor_pose_graph = None
 
-    img_fpaths = glob.glob(f"{raw_dataset_dir}/{building_id}/panos/*.jpg")
-    img_fpaths_dict = {panoid_from_fpath(fpath): fpath for fpath in img_fpaths}
 
-    floor_labels_dirpath = f"{hypotheses_save_root}/{building_id}/{floor_id}"
+def infer_missing_depth_maps(
+    depth_save_root: str,
+    building_id: str,
+    img_fpaths_dict: Dict[int, str],
+    pending_pairs_per_floor: Dict[str, List[Tuple[str, int, str, List[str]]]],
+) -> None:
+    """Infer (in batches) the depth maps that are missing for any panorama of a building's pending pairs.
 
-    args = []
+    Args:
+        depth_save_root: directory where depth maps should be saved (or are already cached here).
+        building_id: unique ID of ZInD building.
+        img_fpaths_dict: mapping from panorama index to panorama file path, for this building.
+        pending_pairs_per_floor: mapping from floor ID to the (label_type, pair_idx, pair_fpath, surface_types)
+            tuples to render on that floor.
+    """
+    # Each panorama generally appears in many pairs.
+    pano_ids = set()
+    for pending_pairs in pending_pairs_per_floor.values():
+        for _, _, pair_fpath, _ in pending_pairs:
+            pano_ids.update(bev_rendering_utils.panoids_from_pair_fpath(pair_fpath))
 
-    for label_type in ["gt_alignment_approx", "incorrect_alignment"]:  # "gt_alignment_exact"
-        pairs = glob.glob(f"{floor_labels_dirpath}/{label_type}/*.json")
-        pairs.sort()
-        print(f"On Building {building_id}, {floor_id}, {label_type}")
+    hohonet_inference_utils.infer_depth_batch_if_nonexistent(
+        depth_save_root=depth_save_root,
+        building_id=building_id,
+        img_fpaths=[img_fpaths_dict[pano_id] for pano_id in sorted(pano_ids)],
+    )
 
-        for pair_idx, pair_fpath in enumerate(pairs):
-            for surface_type in ["floor", "ceiling"]:
-
-                args += [
-                    (
-                        img_fpaths_dict,
-                        surface_type,
-                        pair_fpath,
-                        pair_idx,
-                        label_type,
-                        bev_save_root,
-                        building_id,
-                        floor_id,
-                        depth_save_root,
-                        render_modalities,
-                        layout_save_root,
-                        floor_pose_graph,
-                    )
-                ]
 
-    if multiprocess_building_panos and num_processes > 1:
-        with Pool(num_processes) as p:
-            p.starmap(bev_rendering_utils.generate_texture_maps_for_pair, args)
+def render_building_pairs(
+    depth_save_root: str,
+    bev_save_root: str,
+    raw_dataset_dir: str,
+    building_id: str,
+    img_fpaths_dict: Dict[int, str],
+    pending_pairs_per_floor: Dict[str, List[Tuple[str, int, str, List[str]]]],
+    layout_save_root: Optional[str],
+    render_modalities: List[str],
+    multiprocess_building_panos: bool,
+    num_processes: int,
+) -> None:
+    """Render BEV texture maps for all floors of a single ZinD building.
 
-    else:
-        for single_call_args in args:
-            bev_rendering_utils.generate_texture_maps_for_pair(*single_call_args)
+    Layouts are loaded once for the whole building (the loader returns the layouts of all floors at once),
+    instead of once per floor.
+
+    Args:
+        depth_save_root: directory where depth maps should be saved (or are already cached here).
+        bev_save_root: directory where bird's eye view texture maps should be saved.
+        raw_dataset_dir: path to ZInD dataset.
+        building_id: unique ID of ZInD building.
+        img_fpaths_dict: mapping from panorama index to panorama file path, for this building.
+        pending_pairs_per_floor: mapping from floor ID to the (label_type, pair_idx, pair_fpath, surface_types)
+            tuples to render on that floor.
+        layout_save_root: if rendering rasterized layout, all images will be saved under this directory.
+        render_modalities: type of BEV rendering to generate (either "rgb_texture" or "layout", or both).
+        multiprocess_building_panos: Whether to apply multiprocessing within a single building (i.e. multiprocess
+            the pano pairs for a single building when True), or instead across buildings (one process per building
+            when False).
+        num_processes: number of processes to use for rendering pairs from this building.
+    """
+    # Load the layouts that we will render (either inferred or GT layout).
+    use_inferred_wdos_layout = True
+    floor_pose_graphs = None
+    if "layout" in render_modalities and use_inferred_wdos_layout:
+        floor_pose_graphs = hnet_prediction_loader.load_inferred_floor_pose_graphs(
+            building_id=building_id, raw_dataset_dir=raw_dataset_dir
+        )
+        if floor_pose_graphs is None:
+            return
+
+    bev_rendering_utils.make_rendering_dirs(
+        bev_save_root=bev_save_root,
+        layout_save_root=layout_save_root,
+        building_id=building_id,
+        label_types=sorted(
+            {label_type for pending_pairs in pending_pairs_per_floor.values() for label_type, _, _, _ in pending_pairs}
+        ),
+        render_modalities=render_modalities,
+    )
+
+    for floor_id, pending_pairs in pending_pairs_per_floor.items():
+        if "layout" not in render_modalities:
+            floor_pose_graph = None
+        elif use_inferred_wdos_layout:
+            floor_pose_graph = floor_pose_graphs[floor_id]
+        else:
+            floor_pose_graph = posegraph2d.get_gt_pose_graph(building_id, floor_id, raw_dataset_dir)
+
+        render_building_floor_pairs(
+            depth_save_root=depth_save_root,
+            bev_save_root=bev_save_root,
+            building_id=building_id,
+            floor_id=floor_id,
+            img_fpaths_dict=img_fpaths_dict,
+            pending_pairs=pending_pairs,
+            layout_save_root=layout_save_root,
+            render_modalities=render_modalities,
+            floor_pose_graph=floor_pose_graph,
+            multiprocess_building_panos=multiprocess_building_panos,
+            num_processes=num_processes,
+        )
 
 
 def render_pairs(
@@ -157,7 +391,7 @@ def render_pairs(
         # Generate renderings for only one specific building.
         building_ids = [building_id]
 
-    args = []
+    kwargs = []
 
     for building_id in building_ids:
         if building_id == "1348":
@@ -167,28 +401,69 @@ def render_pairs(
         floor_ids = posegraph2d.compute_available_floors_for_building(
             building_id=building_id, raw_dataset_dir=raw_dataset_dir
         )
+        img_fpaths = list_files_with_suffix(f"{raw_dataset_dir}/{building_id}/panos", ".jpg")
+        img_fpaths_dict = {panoid_from_fpath(fpath): fpath for fpath in img_fpaths}
+
+        pending_pairs_per_floor = {}
         for floor_id in floor_ids:
-            args += [
-                (
-                    depth_save_root,
-                    bev_save_root,
-                    hypotheses_save_root,
-                    raw_dataset_dir,
-                    building_id,
-                    floor_id,
-                    layout_save_root,
-                    render_modalities,
-                    multiprocess_building_panos,
-                    num_processes if multiprocess_building_panos else 1,
-                )
-            ]
+            # Skip already-rendered pairs before scheduling any work, so that resuming a partially
+            # completed job does not pay for process startup and JSON parsing of finished floors.
+            pending_pairs = get_pending_floor_pairs(
+                bev_save_root=bev_save_root,
+                hypotheses_save_root=hypotheses_save_root,
+                building_id=building_id,
+                floor_id=floor_id,
+                img_fpaths_dict=img_fpaths_dict,
+                layout_save_root=layout_save_root,
+                render_modalities=render_modalities,
+            )
+            if len(pending_pairs) == 0:
+                print(f"All renderings already exist for Building {building_id}, {floor_id}, skipping...")
+                continue
+            pending_pairs_per_floor[floor_id] = pending_pairs
 
-    if not multiprocess_building_panos and num_processes > 1:
-        with Pool(num_processes) as p:
-            p.starmap(render_building_floor_pairs, args)
-    else:
-        for single_call_args in args:
-            render_building_floor_pairs(*single_call_args)
+        if len(pending_pairs_per_floor) == 0:
+            continue
+
+        if "rgb_texture" in render_modalities:
+            # Depth inference runs on the GPU, so it is done up front in this (single) process, at a larger batch
+            # size, instead of in each of the rendering worker processes (which then only require the CPU).
+            infer_missing_depth_maps(
+                depth_save_root=depth_save_root,
+                building_id=building_id,
+                img_fpaths_dict=img_fpaths_dict,
+                pending_pairs_per_floor=pending_pairs_per_floor,
+            )
+
+        kwargs += [
+            {
+                "building_id": building_id,
+                "img_fpaths_dict": img_fpaths_dict,
+                "pending_pairs_per_floor": pending_pairs_per_floor,
+            }
+        ]
+
+    # Start the buildings with the most pending renderings first (longest-processing-time-first scheduling), to
+    # avoid a long tail where a single large building is rendered after all other workers have finished.
+    kwargs.sort(
+        key=lambda building_kwargs: sum(len(pairs) for pairs in building_kwargs["pending_pairs_per_floor"].values()),
+        reverse=True,
+    )
+
+    run_tasks(
+        func=render_building_pairs,
+        kwargs=kwargs,
+        num_processes=num_processes if not multiprocess_building_panos else 1,
+        shared_kwargs={
+            "depth_save_root": depth_save_root,
+            "bev_save_root": bev_save_root,
+            "raw_dataset_dir": raw_dataset_dir,
+            "layout_save_root": layout_save_root,
+            "render_modalities": render_modalities,
+            "multiprocess_building_panos": multiprocess_building_panos,
+            "num_processes": num_processes if multiprocess_building_panos else 1,
+        },
+    )
 
 
 @click.command(help="Script to render BEV texture maps for each feasible alignment hypothesis.")
@@ -204,9 +204,10 @@ def plot_confidence_histograms(measurements: List[EdgeClassification]) -> None:
     Args:
         measurements: possible relative pose hypotheses, before confidence thresholding is applied.
     """
-    probs = np.array([m.prob for m in measurements])
-    y_true_array = np.array([m.y_true for m in measurements])
-    y_hat_array = np.array([m.y_hat for m in measurements])
+    num_measurements = len(measurements)
+    probs = np.fromiter((m.prob for m in measurements), dtype=np.float64, count=num_measurements)
+    y_true_array = np.fromiter((m.y_true for m in measurements), dtype=np.int8, count=num_measurements)
+    y_hat_array = np.fromiter((m.y_hat for m in measurements), dtype=np.int8, count=num_measurements)
     is_TP, is_FP, is_FN, is_TN = pr_utils.assign_tp_fp_fn_tn(y_true_array, y_hat_array)
 
     plt.subplot(2, 2, 1)
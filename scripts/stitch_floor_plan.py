@@ -1,26 +1,480 @@
 """Script to execute floorplan stitching using localized panos and estimated layouts."""
 
+import functools
+import itertools
 import json
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 
 import click
-import gtsfm.utils.io as io_utils
-import matplotlib.pyplot as plt
+import numpy as np
+import shapely
+import shapely.ops
 from tqdm import tqdm
+from matplotlib import rcParams
 from matplotlib.figure import Figure
+from shapely.geometry import Polygon
 
 import salve.stitching.draw as draw_utils
 import salve.stitching.ground_truth_utils as ground_truth_utils
 import salve.stitching.shape as shape_utils
 import salve.stitching.transform as transform_utils
+import salve.utils.io as io_utils
 from salve.stitching.models.floor_map_object import FloorMapObject
 from salve.stitching.models.locations import Point2d, Pose
 
 
-def main(output_dir: Path, est_localization_fpath: Path, hnet_pred_dir: Path, path_gt_floor_map: Path) -> None:
-    """TODO
+# Maximum number of threads used to load the per-pano HorizonNet prediction files of a cluster.
+MAX_JSON_LOADING_THREADS = 16
+
+# W/D/O types, paired with the room shape key under which ZInD stores their annotations.
+WDO_TYPES_AND_ROOM_SHAPE_KEYS = (("door", "doors"), ("window", "windows"), ("opening", "openings"))
+
+# Line drawings look the same at 150 DPI as at 600 DPI, but encode many times faster.
+DEFAULT_FINAL_FIGURE_DPI = 150
+# Skip extra JPEG encoding passes.
+FINAL_JPEG_PIL_KWARGS = {"quality": 85, "optimize": False, "progressive": False}
+
+# Arrays of a pano's room shape prediction that are used for stitching. See `load_room_shape_prediction()`.
+ROOM_SHAPE_PREDICTION_KEYS = ("corners_in_uv", "floor_boundary", "floor_boundary_uncertainty")
+
+# Complex GT floor shapes are split into tiles with at most this many vertices, before intersecting them.
+MAX_GT_TILE_VERTICES = 256
+
+# Number of clusters whose scores are computed and written to disk together.
+SCORING_BATCH_SIZE = 64
+
+# Figures reused across the clusters processed by a single process, keyed by name. See `_get_cleared_figure()`.
+_REUSABLE_FIGURES: Dict[str, Figure] = {}
+SUBPLOT_PARAM_KEYS = ("left", "bottom", "right", "top", "wspace", "hspace")
+
+
+class GtFloor(NamedTuple):
+    """GT panos and room shapes of a single floor.
+
+    Attributes:
+        panoids: IDs of all panos on the floor.
+        primary_panoids: IDs of the primary panos on the floor, i.e. those that define their room's coordinate system.
+        room_polys: GT room shape of each primary pano, in global coordinates.
+        room_tree: spatial index over `room_polys`.
+        floor_poly: union of all GT room shapes of the floor.
+    """
+
+    panoids: List[str]
+    primary_panoids: List[str]
+    room_polys: List[Polygon]
+    room_tree: shapely.STRtree
+    floor_poly: Any
+
+
+# GT floors, keyed by floor shape ID, computed once per process by `get_gt_floor()`.
+_GT_FLOOR_BY_FSID: Dict[Optional[str], GtFloor] = {}
+
+# Keyword arguments shared by all clusters, set once per worker process by `_init_worker()`.
+_WORKER_SHARED_KWARGS: Dict[str, Any] = {}
+
+
+def _init_worker(shared_kwargs: Dict[str, Any]) -> None:
+    """Store the keyword arguments that are shared by all clusters, once per worker process."""
+    global _WORKER_SHARED_KWARGS
+    _WORKER_SHARED_KWARGS = shared_kwargs
+
+
+def _process_cluster_in_worker(
+    cluster_args: Tuple[int, Dict[str, Any], Optional[str]]
+) -> Tuple[Any, Polygon, Polygon, Polygon]:
+    """Process a single cluster in a worker process (`ProcessPoolExecutor.map` only passes a single argument)."""
+    i_cluster, cluster, fsid = cluster_args
+    return process_cluster(i_cluster=i_cluster, cluster=cluster, fsid=fsid, **_WORKER_SHARED_KWARGS)
+
+
+def _get_cleared_figure(name: str) -> Figure:
+    """Get an empty figure, reusing the one previously returned under the same name.
+
+    Only the axes are rebuilt for each cluster, instead of the whole figure and its canvas.
+    """
+    figure = _REUSABLE_FIGURES.get(name)
+    if figure is None:
+        figure = _REUSABLE_FIGURES[name] = Figure()
+    else:
+        figure.clear()
+        # `clear()` keeps the subplot parameters set by `tight_layout()`, so restore the defaults.
+        figure.subplots_adjust(**{key: rcParams[f"figure.subplot.{key}"] for key in SUBPLOT_PARAM_KEYS})
+    return figure
+
+
+def get_gt_floor(fsid: Optional[str], floor_map_gt_object: FloorMapObject, primary_panoid_set: Set[str]) -> GtFloor:
+    """Get the GT panos and room shapes of a floor, computing them only once for all clusters on that floor.
+
+    Args:
+        fsid: ID of the GT floor shape, or None if the floor is not annotated.
+        floor_map_gt_object: ground-truth ZInD floor map, wrapped for pose and room shape queries.
+        primary_panoid_set: IDs of all primary panoramas in the GT floor map.
+
+    Returns:
+        GT panos and room shapes of the floor. Empty if `fsid` is None.
+    """
+    if fsid not in _GT_FLOOR_BY_FSID:
+        panoids = floor_map_gt_object.get_panoids_with_floor_id(fsid) if fsid else []
+        primary_panoids = [panoid for panoid in panoids if panoid in primary_panoid_set]
+        room_polys = ground_truth_utils.get_posed_room_shape_polygons(floor_map_gt_object, primary_panoids)
+        _GT_FLOOR_BY_FSID[fsid] = GtFloor(
+            panoids=panoids,
+            primary_panoids=primary_panoids,
+            room_polys=room_polys,
+            room_tree=shapely.STRtree(room_polys),
+            # Union all GT rooms of the floor at once, rather than merging them one by one.
+            floor_poly=shapely.ops.unary_union(room_polys),
+        )
+    return _GT_FLOOR_BY_FSID[fsid]
+
+
+def get_gt_dwos_by_room_shape_id(floor_map_gt_object: FloorMapObject) -> Dict[str, List[Any]]:
+    """Get the W/D/O's of each GT room, in global coordinates.
+
+    Args:
+        floor_map_gt_object: ground-truth ZInD floor map, wrapped for pose and room shape queries.
+
+    Returns:
+        Mapping from GT room shape ID to the W/D/O's of that room, each as (start point, end point, W/D/O type).
+            Rooms whose global pose cannot be determined are omitted.
+    """
+    dwos_gt_all = {}
+    for rsid in floor_map_gt_object.data["room_shapes"]:
+        try:
+            room_global = floor_map_gt_object.get_room_shape_global(rsid)
+        except Exception:
+            continue
+        dwos_gt_all[rsid] = [
+            [
+                Point2d(obj["position"][0]["x"], obj["position"][0]["y"]),
+                Point2d(obj["position"][1]["x"], obj["position"][1]["y"]),
+                wdo_type,
+            ]
+            for wdo_type, room_shape_key in WDO_TYPES_AND_ROOM_SHAPE_KEYS
+            for obj in room_global[room_shape_key].values()
+        ]
+    return dwos_gt_all
+
+
+def get_primary_panoid_set(pano_room_shape_by_panoid: Dict[str, Dict[str, Any]]) -> Set[str]:
+    """Find all primary panoramas in a GT floor map, i.e. those that define their room's coordinate system.
+
+    Args:
+        pano_room_shape_by_panoid: mapping from panorama ID to its pose entry within its GT room shape.
+
+    Returns:
+        IDs of panoramas located at the origin of their room shape, with zero rotation.
+    """
+    return {
+        panoid
+        for panoid, pano_room_shape in pano_room_shape_by_panoid.items()
+        if pano_room_shape["position"]["x"] == 0
+        and pano_room_shape["position"]["y"] == 0
+        and pano_room_shape["rotation"] == 0
+    }
+
+
+def compute_floor_iou_scores(
+    cluster_indices: List[int],
+    gt_floor_polys: List[Polygon],
+    fused_floor_polys: List[Polygon],
+    gt_overlapping_polys: List[Polygon],
+) -> List[Dict[str, Any]]:
+    """Compare the fused floor shape of each cluster against its GT floor shape.
+
+    The geometric operations are batched over all given clusters, so that GEOS is called once per operation.
+
+    Args:
+        cluster_indices: index of each cluster.
+        gt_floor_polys: union of the GT room shapes of each cluster's floor.
+        fused_floor_polys: union of the fused room shapes of each cluster.
+        gt_overlapping_polys: union of the GT room shapes of each cluster's floor that intersect its fused floor shape.
+
+    Returns:
+        scores: IoU and areas of the fused floor shape vs. the GT floor shape, for each cluster.
+    """
+    gt_floor_polys_arr = np.empty(len(gt_floor_polys), dtype=object)
+    gt_floor_polys_arr[:] = gt_floor_polys
+    fused_floor_polys_arr = np.empty(len(fused_floor_polys), dtype=object)
+    fused_floor_polys_arr[:] = fused_floor_polys
+
+    areas_gt = shapely.area(gt_floor_polys_arr)
+    areas_pred = shapely.area(fused_floor_polys_arr)
+    # GT rooms that don't overlap the fused shape don't contribute to the intersection, so it is computed against the
+    # overlapping rooms only. Overlaying a shape with many vertices is slow, so the GT shape is split into small tiles,
+    # and the areas of intersection with each tile are summed up. A cheap test on the prepared tiles skips computing
+    # the intersection for tiles that don't overlap the fused shape at all.
+    gt_tiles = []
+    tile_cluster_idxs = []
+    for i, gt_overlapping_poly in enumerate(gt_overlapping_polys):
+        tiles = shape_utils.subdivide_polygon(gt_overlapping_poly, max_vertices=MAX_GT_TILE_VERTICES)
+        gt_tiles.extend(tiles)
+        tile_cluster_idxs.extend([i] * len(tiles))
+    gt_tiles_arr = np.empty(len(gt_tiles), dtype=object)
+    gt_tiles_arr[:] = gt_tiles
+    tile_cluster_idxs = np.array(tile_cluster_idxs, dtype=int)
+    fused_floor_polys_per_tile = fused_floor_polys_arr[tile_cluster_idxs]
+
+    shapely.prepare(gt_tiles_arr)
+    is_overlapping = shapely.intersects(gt_tiles_arr, fused_floor_polys_per_tile)
+    areas_tile_intersection = shapely.area(
+        shapely.intersection(gt_tiles_arr[is_overlapping], fused_floor_polys_per_tile[is_overlapping])
+    )
+    areas_intersection = np.bincount(
+        tile_cluster_idxs[is_overlapping], weights=areas_tile_intersection, minlength=len(gt_floor_polys)
+    )
+    # Inclusion-exclusion avoids overlaying the GT and fused shapes a second time.
+    areas_union = areas_gt + areas_pred - areas_intersection
+    ious = areas_intersection / areas_union
+    return [
+        {
+            "i_cluster": i_cluster,
+            "iou_all": float(ious[i]),
+            "area_gt_all": float(areas_gt[i]),
+            "area_pred_all": float(areas_pred[i]),
+            "area_union_all": float(areas_union[i]),
+            "area_intersection_all": float(areas_intersection[i]),
+        }
+        for i, i_cluster in enumerate(cluster_indices)
+    ]
+
+
+def save_cluster_scores(
+    cluster_results: Iterator[Tuple[Any, Polygon, Polygon, Polygon]], scores_fpath: Path
+) -> None:
+    """Score clusters as their results arrive, and append the scores to a JSON Lines file (one cluster per line).
+
+    Results are consumed in batches, so that memory stays bounded for long tours, and the scores of all completed
+    batches are kept on disk if a later cluster fails.
+
+    Args:
+        cluster_results: per-cluster outputs of `process_cluster()`, in cluster order.
+        scores_fpath: Path to JSON Lines file to write.
+    """
+    i_cluster_start = 0
+    with open(scores_fpath, "w") as f:
+        while True:
+            batch = list(itertools.islice(cluster_results, SCORING_BATCH_SIZE))
+            if len(batch) == 0:
+                break
+            scores = compute_floor_iou_scores(
+                cluster_indices=list(range(i_cluster_start, i_cluster_start + len(batch))),
+                gt_floor_polys=[poly_gt_union for _, poly_gt_union, _, _ in batch],
+                fused_floor_polys=[floor_shape_fused_poly for _, _, floor_shape_fused_poly, _ in batch],
+                gt_overlapping_polys=[poly_gt_overlapping for _, _, _, poly_gt_overlapping in batch],
+            )
+            f.writelines(json.dumps(score) + "\n" for score in scores)
+            f.flush()
+            i_cluster_start += len(batch)
+
+
+@functools.lru_cache(maxsize=None)
+def load_room_shape_prediction(madori_prediction_fpath: Path, cache_dir: Path) -> Dict[str, np.ndarray]:
+    """Load the HorizonNet room shape prediction for a single pano, using an on-disk cache of the parsed arrays.
+
+    Parsing the JSON predictions dominates loading time, so the arrays needed for stitching are cached in a .npz
+    file per pano. The cache is keyed on the modification time of the JSON file, and is invalidated automatically.
+    A pano may belong to several clusters, so results are also memoized in memory, for the lifetime of the process.
+    The returned arrays are shared between callers, and must not be modified.
+
+    Args:
+        madori_prediction_fpath: Path to per-pano JSON file with HorizonNet predictions, under a directory named
+            after the pano ID.
+        cache_dir: Directory where cached arrays are stored.
+
+    Returns:
+        Dictionary with the room shape corners (`corners_in_uv`), and the dense floor boundary (`floor_boundary`)
+            and its uncertainty (`floor_boundary_uncertainty`).
+    """
+    mtime_ns = madori_prediction_fpath.stat().st_mtime_ns
+    cache_fpath = cache_dir / f"{madori_prediction_fpath.parent.name}.npz"
+    if cache_fpath.exists():
+        with np.load(cache_fpath) as cached:
+            if int(cached["mtime_ns"]) == mtime_ns:
+                return {key: cached[key] for key in ROOM_SHAPE_PREDICTION_KEYS}
+
+    room_shape_pred = io_utils.read_json_file(madori_prediction_fpath)[0]["predictions"]["room_shape"]
+    room_shape_arrays = {
+        "corners_in_uv": np.asarray(room_shape_pred["corners_in_uv"], dtype=np.float64),
+        "floor_boundary": np.asarray(room_shape_pred["raw_predictions"]["floor_boundary"], dtype=np.float64),
+        "floor_boundary_uncertainty": np.asarray(
+            room_shape_pred["raw_predictions"]["floor_boundary_uncertainty"], dtype=np.float64
+        ),
+    }
+    # Write to a temporary file first, so that concurrent readers never observe a partially written cache.
+    tmp_cache_fpath = cache_fpath.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_cache_fpath, "wb") as f:
+        np.savez(f, mtime_ns=mtime_ns, **room_shape_arrays)
+    os.replace(tmp_cache_fpath, cache_fpath)
+    return room_shape_arrays
+
+
+def process_cluster(
+    i_cluster: int,
+    cluster: Dict[str, Any],
+    fsid: Optional[str],
+    floor_map_gt: Dict[str, Any],
+    floor_map_gt_object: FloorMapObject,
+    dwos_gt_all: Dict[str, List[Any]],
+    primary_panoid_set: Set[str],
+    rsid_by_panoid: Dict[str, str],
+    hnet_pred_dir: Path,
+    output_dir: Path,
+    dpi: int,
+) -> Tuple[Any, Polygon, Polygon, Polygon]:
+    """Stitch the floorplan of a single cluster of localized panoramas, and compare it against the GT floorplan.
+
+    Args:
+        i_cluster: index of the cluster.
+        cluster: mapping from panorama ID to estimated pose (aligned to the GT floor map).
+        fsid: ID of the GT floor shape the cluster belongs to, or None if the floor is not annotated.
+        floor_map_gt: ground-truth ZInD floor map.
+        floor_map_gt_object: ground-truth ZInD floor map, wrapped for pose and room shape queries.
+        dwos_gt_all: mapping from GT room shape ID to W/D/O's of that room, in global coordinates. Only rooms in
+            this mapping have their W/D/O's drawn.
+        primary_panoid_set: IDs of all primary panoramas in the GT floor map.
+        rsid_by_panoid: mapping from panorama ID to the ID of the GT room shape it was captured in.
+        hnet_pred_dir: Directory to where HorizonNet per-pano room shape and DWO predictions are stored.
+        output_dir: Path to directory where stitched outputs will be saved to.
+        dpi: resolution (dots per inch) of the saved fused floorplan figures.
+
+    Returns:
+        floor_shape_final: fused shapes of each room of the cluster.
+        poly_gt_union: union of the GT room shapes of the cluster's floor.
+        floor_shape_fused_poly: union of the fused room shapes of the cluster.
+        poly_gt_overlapping: union of the GT room shapes of the cluster's floor that intersect `floor_shape_fused_poly`.
+    """
+    print(f"Start process on cluster {i_cluster} ... ")
+    cluster_dir = output_dir / "fused" / f"cluster_{i_cluster}"
+    cluster_dir.mkdir(exist_ok=True, parents=True)
+
+    predicted_corner_shapes = {}
+    predicted_shapes_raw = {}
+    location_panos = {}
+    wall_confidences = {}
+    vis_path = output_dir / f"cluster_{i_cluster}.png"
+
+    print(f"Loading cluster {len(cluster)} panos ... ")
+    # Per-pano predictions live in separate files, so loading is I/O-bound and is overlapped across threads.
+    madori_prediction_fpaths = [hnet_pred_dir / panoid / "rmx-madori-v1_predictions.json" for panoid in cluster]
+    cache_dir = output_dir / ".cache"
+    cache_dir.mkdir(exist_ok=True)
+    with ThreadPoolExecutor(max_workers=MAX_JSON_LOADING_THREADS) as executor:
+        room_shape_preds = list(
+            executor.map(lambda fpath: load_room_shape_prediction(fpath, cache_dir), madori_prediction_fpaths)
+        )
+
+    primary_panoids = []
+    # Floor boundaries of panos with a valid room shape, whose dense shapes are generated together below.
+    dense_shape_panoids = []
+    floor_boundaries = []
+    floor_boundary_uncertainties = []
+    # `panoid` will be a string ID, e.g. `065cd4e4e0`
+    for panoid, room_shape_pred in zip(cluster, room_shape_preds):
+        if panoid in primary_panoid_set:
+            primary_panoids.append(panoid)
+
+        if len(room_shape_pred["corners_in_uv"]) < 3:
+            continue
+        dense_shape_panoids.append(panoid)
+        floor_boundaries.append(room_shape_pred["floor_boundary"])
+        floor_boundary_uncertainties.append(room_shape_pred["floor_boundary_uncertainty"])
+        predicted_corner_shapes[panoid] = shape_utils.load_room_shape_polygon_from_predictions(
+            room_shape_pred=room_shape_pred["corners_in_uv"]
+        )
+
+        pose_raw = cluster[panoid]["pose"]
+        pose = Pose(position=Point2d(x=pose_raw["x"], y=pose_raw["y"]), rotation=pose_raw["rotation"])
+        location_panos[panoid] = pose
+
+    if len(dense_shape_panoids) > 0:
+        dense_shapes = shape_utils.generate_dense_shapes(
+            v_vals=np.asarray(floor_boundaries), uncertainty=np.asarray(floor_boundary_uncertainties)
+        )
+        for panoid, (predicted_shape_raw, wall_confidence) in zip(dense_shape_panoids, dense_shapes):
+            predicted_shapes_raw[panoid] = predicted_shape_raw
+            wall_confidences[panoid] = wall_confidence
+
+    groups = shape_utils.group_panos_by_room(predicted_corner_shapes, location_panos)
+
+    print("Running shape refinement ... ")
+    floor_shape_final, figure, floor_shape_fused_poly = shape_utils.refine_predicted_shape(
+        groups=groups,
+        predicted_shapes=predicted_shapes_raw,
+        wall_confidences=wall_confidences,
+        location_panos=location_panos,
+        cluster_dir=cluster_dir,
+        tour_dir=output_dir,
+        figure=_get_cleared_figure("fused"),
+        dpi=dpi,
+    )
+
+    print("Drawing room shapes ... ")
+    gt_axis1 = figure.add_subplot(1, 2, 2)
+    gt_floor = get_gt_floor(fsid, floor_map_gt_object, primary_panoid_set)
+    panoids_all = gt_floor.panoids
+    primary_panoids_all = gt_floor.primary_panoids
+    poly_gt_union1 = gt_floor.floor_poly
+    # Look up the GT rooms overlapping the fused floor shape with a spatial index, so that the intersection is later
+    # computed against those rooms only. The fused shape is prepared once, and reused to test each candidate room.
+    shapely.prepare(floor_shape_fused_poly)
+    overlapping_room_idxs = gt_floor.room_tree.query(floor_shape_fused_poly, predicate="intersects")
+    if len(overlapping_room_idxs) == len(gt_floor.room_polys):
+        poly_gt_overlapping = poly_gt_union1
+    else:
+        poly_gt_overlapping = shapely.ops.unary_union([gt_floor.room_polys[i] for i in overlapping_room_idxs])
+    draw_utils.draw_all_room_shapes_with_poses(
+        None, floor_map_gt, primary_panoids_all, axis=gt_axis1, floor_map_obj=floor_map_gt_object
+    )
+    rsids = [rsid_by_panoid[this_panoid] for this_panoid in primary_panoids_all]
+    # `dwos_gt_all` is empty unless GT W/D/O's are drawn.
+    dwos_gt_this = {rsid: dwos_gt_all[rsid] for rsid in rsids if rsid in dwos_gt_all}
+    draw_utils.draw_dwo_xy_top_down_canvas(gt_axis1, figure, "", dwos_gt_this)
+    for panoid in panoids_all:
+        if panoid in primary_panoids_all:
+            continue
+        pose_ref = floor_map_gt_object.get_pano_global_pose(panoid)
+        draw_utils.draw_camera_in_top_down_canvas(gt_axis1, pose_ref, "black", size=10)
+
+    # Share the same limits across all subplots. Rows are (xmin, xmax, ymin, ymax), one per axes.
+    limits = np.array([axis.get_xlim() + axis.get_ylim() for axis in figure.axes])
+    xlim = [limits[:, 0].min(), limits[:, 1].max()]
+    ylim = [limits[:, 2].min(), limits[:, 3].max()]
+    for axis in figure.axes:
+        axis.set_xlim(xlim)
+        axis.set_ylim(ylim)
+    figure.tight_layout(pad=0.1)
+    figure.savefig(cluster_dir / "final.jpg", dpi=dpi, pil_kwargs=FINAL_JPEG_PIL_KWARGS)
+
+    axes, fig = draw_utils.draw_all_room_shapes_with_given_poses_and_shapes(
+        filename=vis_path,
+        floor_map_gt=floor_map_gt,
+        panoid_refs=predicted_corner_shapes.keys(),
+        predictions_by_title={"Corner room shapes": predicted_corner_shapes, "Dense room shapes": predicted_shapes_raw},
+        confidences=wall_confidences,
+        poses=location_panos,
+        groups=groups,
+        figure=_get_cleared_figure("shapes"),
+    )
+    return floor_shape_final, poly_gt_union1, floor_shape_fused_poly, poly_gt_overlapping
+
+
+def main(
+    output_dir: Path,
+    est_localization_fpath: Path,
+    hnet_pred_dir: Path,
+    path_gt_floor_map: Path,
+    num_processes: int,
+    dpi: int = DEFAULT_FINAL_FIGURE_DPI,
+    with_gt_dwo: bool = False,
+) -> None:
+    """Stitch the floorplan of each cluster of localized panoramas, and evaluate it against the GT floorplan.
+
+    Clusters are independent of one another, and are processed in parallel if `num_processes` > 1.
 
     Args:
         output_dir: Path to directory where stitched outputs will be saved to.
@@ -28,282 +482,64 @@ def main(output_dir: Path, est_localization_fpath: Path, hnet_pred_dir: Path, pa
             generated by SALVe + global optimization.
         hnet_pred_dir: Directory to where HorizonNet per-pano room shape and DWO predictions are stored.
         path_gt_floor_map: Path to gt ZInD floor_map.json file.
+        num_processes: number of worker processes to use for processing clusters.
+        dpi: resolution (dots per inch) of each cluster's saved fused floorplan figures.
+        with_gt_dwo: whether to draw the GT W/D/O's alongside each cluster's GT floorplan.
     """
     print(f"Start processing ... ")
-    
-    output_dir.mkdir(exist_ok=True, parents=True)
-    cluster_dir = os.path.join(output_dir, "fused")
-    Path(cluster_dir).mkdir(exist_ok=True, parents=True)
+    (output_dir / "fused").mkdir(exist_ok=True, parents=True)
 
     # Load floor_map file with annotated room shape and gt room shape transformations.
-    ###floor_map_gt = io_utils.read_json_file(path_gt_floor_map)
+    floor_map_gt = io_utils.read_json_file(path_gt_floor_map)
     localizations = io_utils.read_json_file(est_localization_fpath)
 
-    # clusters = []
-    # for i_cluster, cluster in enumerate(localizations['global_clusters']):
-    #     clusters.append({})
-    #     clusters[i_cluster] = {
-    #         key: val for key, val in cluster['panos'].items()
-    #     }
-
-    predicted_corner_shapes_all = []
-    location_panos_all = []
-    dwos_cluster_all = []
-    wall_confidences_all = []
-    shapes_by_floor = []
-
-    ###floor_map_gt_object = FloorMapObject(floor_map_gt)
-    ###dwos_gt_all = {}
-    ###for rsid in floor_map_gt["room_shapes"]:
-    ###    try:
-    ###        room_global = floor_map_gt_object.get_room_shape_global(rsid)
-    ###    except Exception:
-    ###        continue
-    ###    this_all = []
-    ###    for type in ["doors", "windows", "openings"]:
-    ###        for wfid, obj in room_global[type].items():
-    ###            this_all.append(
-    ###                [
-    ###                    Point2d(obj["position"][0]["x"], obj["position"][0]["y"]),
-    ###                    Point2d(obj["position"][1]["x"], obj["position"][1]["y"]),
-    ###                    type[:-1],
-    ###                ]
-    ###            )
-    ###    dwos_gt_all[rsid] = this_all
-    import pdb; pdb.set_trace()
+    floor_map_gt_object = FloorMapObject(floor_map_gt)
+    # Globally posing every GT W/D/O is only needed to draw them, so it is skipped unless requested.
+    dwos_gt_all = get_gt_dwos_by_room_shape_id(floor_map_gt_object) if with_gt_dwo else {}
+
     clusters = []
     floor_ids = []
     for item in localizations:
         cluster_aligned = ground_truth_utils.align_pred_poses_with_gt(floor_map_gt_object=floor_map_gt_object, cluster=item)
         clusters.append(cluster_aligned["panos"])
         floor_ids.append(cluster_aligned["floor_id"])
-    # clusters = ground_truth_utils.convert_floor_map_to_localization_cluster(floor_map_gt_object)
-
-    all_scores = []
-    for i_cluster, cluster in enumerate(clusters):
-        print(f"Start process on cluster {i_cluster} ... ")
-        cluster_name = f"cluster_{i_cluster}"
-        cluster_dir = os.path.join(output_dir, "fused", cluster_name)
-        if not Path(cluster_dir).exists():
-            Path(cluster_dir).mkdir(exist_ok=True, parents=True)
-
-        predicted_corner_shapes = {}
-        predicted_shapes_raw = {}
-        dwos_cluster = {}
-        location_panos = {}
-        wall_confidences = {}
-        filename = f"cluster_{i_cluster}.png"
-        filename_raw = f"cluster_raw_{i_cluster}.png"
-        vis_path = os.path.join(output_dir, filename)
-        vis_raw_path = os.path.join(output_dir, filename_raw)
-
-        print(f"Loading cluster {len(cluster)} panos ... ")
-        primary_panoids = []
-        # `panoid` will be a string ID, e.g. `065cd4e4e0`
-        for i_pano, panoid in enumerate(cluster):
-            path_madori_prediction = hnet_pred_dir / panoid / "rmx-madori-v1_predictions.json"
-            pred = io_utils.read_json_file(path_madori_prediction)
-
-            rsid = floor_map_gt["panos"][panoid]["room_shape_id"]
-            pano_room_shape = floor_map_gt["room_shapes"][rsid]["panos"][panoid]
-            is_primary = (
-                pano_room_shape["position"]["x"] == 0
-                and pano_room_shape["position"]["y"] == 0
-                and pano_room_shape["rotation"] == 0
-            )
-            if is_primary:
-                primary_panoids.append(panoid)
 
-            if len(pred[0]["predictions"]["room_shape"]["corners_in_uv"]) < 3:
-                continue
-            wall_confidences[panoid] = pred[0]["predictions"]["room_shape"]["raw_predictions"][
-                "floor_boundary_uncertainty"
-            ]
-            predicted_shapes_raw[panoid], wall_confidences[panoid] = shape_utils.generate_dense_shape(
-                v_vals=pred[0]["predictions"]["room_shape"]["raw_predictions"]["floor_boundary"],
-                uncertainty=wall_confidences[panoid],
-            )
-            predicted_corner_shapes[panoid] = shape_utils.load_room_shape_polygon_from_predictions(
-                room_shape_pred=pred[0]["predictions"]["room_shape"]["corners_in_uv"]
-            )
-
-            pose_raw = cluster[panoid]["pose"]
-            pose = Pose(position=Point2d(x=pose_raw["x"], y=pose_raw["y"]), rotation=pose_raw["rotation"])
-            location_panos[panoid] = pose
-            # dwos = []
-            # for type in ['window', 'door', 'opening']:
-            #     for dwo_uv_pred in pred[0]['predictions']['wall_features'][type]:
-            #         xys = transform_utils.ray_cast_and_generate_dwo_xy(dwo_uv_pred, predicted_corner_shapes[panoid])
-            #         if not xys[0] or not xys[1]:
-            #             continue
-            #         dwos.append([
-            #             transform_utils.transform_xy_by_pose(xys[0], pose),
-            #             transform_utils.transform_xy_by_pose(xys[1], pose),
-            #             type
-            #         ])
-            # dwos_cluster[panoid] = dwos
-
-        predicted_corner_shapes_all.append(predicted_corner_shapes)
-        location_panos_all.append(location_panos)
-        # dwos_cluster_all.append(dwos_cluster)
-        wall_confidences_all.append(wall_confidences)
-
-        groups = shape_utils.group_panos_by_room(predicted_corner_shapes, location_panos)
-
-        print("Running shape refinement ... ")
-        floor_shape_final, figure, floor_shape_fused_poly = shape_utils.refine_predicted_shape(
-            groups=groups,
-            predicted_shapes=predicted_shapes_raw,
-            wall_confidences=wall_confidences,
-            location_panos=location_panos,
-            cluster_dir=cluster_dir,
-            tour_dir=output_dir,
-        )
-        shapes_by_floor.append(floor_shape_final)
-
-        print("Drawing room shapes ... ")
-        # gt_axis = figure.add_subplot(1, 3, 2)
-        # poly_gt_union = draw_utils.draw_all_room_shapes_with_poses(None, floor_map_gt, primary_panoids, axis=gt_axis)
-        # for panoid in cluster:
-        #     if panoid in primary_panoids:
-        #         continue
-        #     pose_ref = floor_map_gt_object.get_pano_global_pose(panoid)
-        #     draw_utils.draw_camera_in_top_down_canvas(gt_axis, pose_ref, "green", size=10)
-        #
-        # area_gt = poly_gt_union.area
-        # area_pred = floor_shape_fused_poly.area
-        # area_union = poly_gt_union.union(floor_shape_fused_poly).area
-        # area_intersection = poly_gt_union.intersection(floor_shape_fused_poly).area
-        # iou = area_intersection / area_union
-        # all_scores.append({
-        #     "i_cluster": i_cluster,
-        #     "iou": iou,
-        #     "area_gt": area_gt,
-        #     "area_pred": area_pred,
-        #     "area_union": area_union,
-        #     "area_intersection": area_intersection
-        # })
-
-        # for panoid in cluster:
-        #     if panoid in primary_panoids:
-        #         continue
-        #     pose_ref = floor_map_gt_object.get_pano_global_pose(panoid)
-        #     draw_utils.draw_camera_in_top_down_canvas(gt_axis, pose_ref, "black", size=10)
-
-        gt_axis1 = figure.add_subplot(1, 2, 2)
-        floor_id = floor_ids[i_cluster]
-        fsid = None
-        for fsid_this, floor_shape in floor_map_gt["floor_shapes"].items():
-            if floor_shape["floor_number"] == int(floor_id.split("_")[-1]):
-                fsid = fsid_this
-
-        panoids_all = []
-        primary_panoids_all = []
-        if fsid:
-            panoids_all = floor_map_gt_object.get_panoids_with_floor_id(fsid)
-            for panoid_this in panoids_all:
-                rsid = floor_map["panos"][panoid_this]["room_shape_id"]
-                pano_room_shape = floor_map_gt["room_shapes"][rsid]["panos"][panoid_this]
-                is_primary = (
-                    pano_room_shape["position"]["x"] == 0
-                    and pano_room_shape["position"]["y"] == 0
-                    and pano_room_shape["rotation"] == 0
-                )
-                if is_primary:
-                    primary_panoids_all.append(panoid_this)
-
-        poly_gt_union1 = draw_utils.draw_all_room_shapes_with_poses(None, floor_map_gt, primary_panoids_all, axis=gt_axis1)
-        rsids = [floor_map_gt["panos"][this_panoid]["room_shape_id"] for this_panoid in primary_panoids_all]
-        dwos_gt_this = {}
-        for rsid in rsids:
-            dwos_gt_this[rsid] = dwos_gt_all[rsid]
-        draw_utils.draw_dwo_xy_top_down_canvas(gt_axis1, figure, "", dwos_gt_this)
-        for panoid in panoids_all:
-            if panoid in primary_panoids_all:
-                continue
-            pose_ref = floor_map_gt_object.get_pano_global_pose(panoid)
-            draw_utils.draw_camera_in_top_down_canvas(gt_axis1, pose_ref, "black", size=10)
-
-        area_gt1 = poly_gt_union1.area
-        area_pred1 = floor_shape_fused_poly.area
-        area_union1 = poly_gt_union1.union(floor_shape_fused_poly).area
-        area_intersection1 = poly_gt_union1.intersection(floor_shape_fused_poly).area
-        iou1 = area_intersection1 / area_union1
-        # all_scores.append({
-        #     "i_cluster": i_cluster,
-        #     "iou": iou,
-        #     "area_gt": area_gt,
-        #     "area_pred": area_pred,
-        #     "area_union": area_union,
-        #     "area_intersection": area_intersection,
-        #     "iou_all": iou1,
-        #     "area_gt_all": area_gt1,
-        #     "area_pred_all": area_pred1,
-        #     "area_union_all": area_union1,
-        #     "area_intersection_all": area_intersection1
-        # })
-
-        xlim_min = min(figure.axes[0].get_xlim()[0], figure.axes[1].get_xlim()[0])
-        xlim_max = max(figure.axes[0].get_xlim()[1], figure.axes[1].get_xlim()[1])
-        ylim_min = min(figure.axes[0].get_ylim()[0], figure.axes[1].get_ylim()[0])
-        ylim_max = max(figure.axes[0].get_ylim()[1], figure.axes[1].get_ylim()[1])
-        # xlim_min = min(figure.axes[0].get_xlim()[0], figure.axes[2].get_xlim()[0])
-        # xlim_max = max(figure.axes[0].get_xlim()[1], figure.axes[2].get_xlim()[1])
-        # ylim_min = min(figure.axes[0].get_ylim()[0], figure.axes[2].get_ylim()[0])
-        # ylim_max = max(figure.axes[0].get_ylim()[1], figure.axes[2].get_ylim()[1])
-        figure.axes[0].set_xlim([xlim_min, xlim_max])
-        figure.axes[0].set_ylim([ylim_min, ylim_max])
-        figure.axes[1].set_xlim([xlim_min, xlim_max])
-        figure.axes[1].set_ylim([ylim_min, ylim_max])
-        # figure.axes[2].set_xlim([xlim_min, xlim_max])
-        # figure.axes[2].set_ylim([ylim_min, ylim_max])
-        figure.tight_layout(pad=0.1)
-        # plt.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-        # figure.savefig(os.path.join(cluster_dir, 'final.png'), dpi = 300)
-        figure.savefig(os.path.join(cluster_dir, "final.jpg"), dpi=600)
-        # figure.subplots_adjust(bottom=0.1, top=0.1)
-        # figure.savefig(os.path.join(cluster_dir, 'final.png'), dpi = 300)
-
-        axis, fig = draw_utils.draw_all_room_shapes_with_given_poses_and_shapes(
-            filename=vis_path,
-            floor_map=floor_map,
-            panoid_refs=predicted_corner_shapes.keys(),
-            predictions=predicted_corner_shapes,
-            confidences=wall_confidences,
-            poses=location_panos,
-            groups=groups,
-        )
-        # draw_utils.draw_dwo_xy_top_down_canvas(axis, fig, vis_path, dwos_cluster)
-        axis, fig = draw_utils.draw_all_room_shapes_with_given_poses_and_shapes(
-            filename=vis_raw_path,
-            floor_map=floor_map,
-            panoid_refs=predicted_corner_shapes.keys(),
-            predictions=predicted_shapes_raw,
-            confidences=wall_confidences,
-            poses=location_panos,
-            groups=groups,
+    # Index the room shape entry of each pano once, instead of chaining nested lookups per pano and per cluster.
+    rsid_by_panoid = {}
+    pano_room_shape_by_panoid = {}
+    for rsid, room_shape in floor_map_gt["room_shapes"].items():
+        for panoid, pano_room_shape in room_shape["panos"].items():
+            rsid_by_panoid[panoid] = rsid
+            pano_room_shape_by_panoid[panoid] = pano_room_shape
+
+    shared_kwargs = {
+        "floor_map_gt": floor_map_gt,
+        "floor_map_gt_object": floor_map_gt_object,
+        "dwos_gt_all": dwos_gt_all,
+        "primary_panoid_set": get_primary_panoid_set(pano_room_shape_by_panoid),
+        "rsid_by_panoid": rsid_by_panoid,
+        "hnet_pred_dir": hnet_pred_dir,
+        "output_dir": output_dir,
+        "dpi": dpi,
+    }
+    # Floor IDs, e.g. `floor_01`, end with the floor number of their GT floor shape.
+    fsid_by_floor_number = {fs["floor_number"]: fsid for fsid, fs in floor_map_gt["floor_shapes"].items()}
+    fsids = [fsid_by_floor_number.get(int(floor_id.rsplit("_", 1)[1])) for floor_id in floor_ids]
+    cluster_args = list(zip(range(len(clusters)), clusters, fsids))
+    scores_fpath = output_dir / "score.jsonl"
+    if num_processes > 1:
+        # The GT floor map is sent to each worker process once, instead of once per cluster.
+        with ProcessPoolExecutor(
+            max_workers=num_processes, initializer=_init_worker, initargs=(shared_kwargs,)
+        ) as executor:
+            cluster_results = executor.map(_process_cluster_in_worker, cluster_args)
+            save_cluster_scores(tqdm(cluster_results, total=len(cluster_args), desc="Clusters"), scores_fpath)
+    else:
+        cluster_results = (
+            process_cluster(i_cluster=i_cluster, cluster=cluster, fsid=fsid, **shared_kwargs)
+            for i_cluster, cluster, fsid in cluster_args
         )
-        # draw_utils.draw_dwo_xy_top_down_canvas(axis, fig, vis_raw_path, dwos_cluster)
-
-    with open(os.path.join(output_dir, "score.json"), "w") as f:
-        json.dump(all_scores, f)
-    # total_group = 0
-    # for cluster in shapes_by_floor:
-    #     total_group += len(cluster)
-    # fig_floor = Figure()
-    # axis_floor = fig_floor.add_subplot(1, 1, 1)
-    # i_group = 0
-    #
-    # for cluster in shapes_by_floor:
-    #     for group in cluster:
-    #         color = hsv2rgb(i_group / total_group, 1, 1)
-    #         i_group += 1
-    #         color = (color[0]/255, color[1]/255, color[2]/255)
-    #         for [xys_fused, conf_fused, pose0] in group:
-    #             draw_utils.draw_shape_in_top_down_canvas_fill(axis_floor, xys_fused, color, pose=pose0)
-    # axis_floor.set_aspect("equal")
-    # path_output = os.path.join(output_dir, f'final.png')
-    # fig_floor.savefig(path_output, dpi = 300)
+        save_cluster_scores(tqdm(cluster_results, total=len(cluster_args), desc="Clusters"), scores_fpath)
 
 
 @click.command(help="Script to run floorplan stitching algorithm, using previously localized poses.")
@@ -332,8 +568,32 @@ def main(output_dir: Path, est_localization_fpath: Path, hnet_pred_dir: Path, pa
     help="Path to JSON ground-truth floor-map annotation from ZInD (`zind_data.json`).",
     type=click.Path(exists=True),
 )
+@click.option(
+    "--num-processes",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of worker processes to use for processing clusters in parallel.",
+)
+@click.option(
+    "--dpi",
+    type=int,
+    default=DEFAULT_FINAL_FIGURE_DPI,
+    help="Resolution (dots per inch) of each cluster's fused floorplan figures (`final.png` and `final.jpg`).",
+)
+@click.option(
+    "--with-gt-dwo",
+    is_flag=True,
+    default=False,
+    help="Whether to draw the GT doors, windows and openings alongside each cluster's GT floorplan.",
+)
 def run_stitch_floor_plan(
-    output_dir: str, est_localization_fpath: str, hnet_pred_dir: str, path_gt_floor_map: str
+    output_dir: str,
+    est_localization_fpath: str,
+    hnet_pred_dir: str,
+    path_gt_floor_map: str,
+    num_processes: int,
+    dpi: int,
+    with_gt_dwo: bool,
 ) -> None:
     """Click entry point for layout stitching script.
 
@@ -345,6 +605,9 @@ def run_stitch_floor_plan(
         est_localization_fpath=Path(est_localization_fpath),
         hnet_pred_dir=Path(hnet_pred_dir),
         path_gt_floor_map=Path(path_gt_floor_map),
+        num_processes=num_processes,
+        dpi=dpi,
+        with_gt_dwo=with_gt_dwo,
     )
 
 
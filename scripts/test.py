@@ -215,6 +215,9 @@ def run_test_epoch(
         else:
             gt_is_match = is_match
 
+        # Test images are normalized here, on the GPU, rather than per-example in the data loader workers.
+        train_utils.normalize_batch(x1, x2, x3, x4, x5, x6)
+
         is_match_probs, loss = train_utils.cross_entropy_forward(model, split, x1, x2, x3, x4, x5, x6, gt_is_match)
 
         y_hat = torch.argmax(is_match_probs, dim=1)
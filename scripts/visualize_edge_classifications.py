@@ -5,7 +5,7 @@ import numpy as np
 
 import salve.common.posegraph2d as posegraph2d
 import salve.utils.pr_utils as pr_utils
-from salve.common.edge_classification import edge_classification
+import salve.common.edge_classification as edge_classification
 
 
 def vis_edge_classifications(serialized_preds_json_dir: str, raw_dataset_dir: str) -> None:
@@ -17,15 +17,30 @@ def vis_edge_classifications(serialized_preds_json_dir: str, raw_dataset_dir: st
             Bridge API).
     """
 
-    # Retrieve EdgeClassifications for thi
-    floor_edgeclassifications_dict = edge_classification.get_edge_classifications_from_serialized_preds(
+    # Retrieve model predictions for all buildings and floors.
+    floor_edgeclassifications_dict = edge_classification.get_edge_classification_arrays_from_serialized_preds(
         serialized_preds_json_dir
     )
+    if len(floor_edgeclassifications_dict) == 0:
+        print(f"No serialized predictions found in {serialized_preds_json_dir}")
+        return
 
     color_dict = {"TP": "green", "FP": "red", "FN": "orange", "TN": "blue"}
+    tn_color = color_dict["TN"]
+
+    # Classify into TPs, FPs, FNs, TNs for all floors at once, and then split the masks back up per floor.
+    floor_measurements = list(floor_edgeclassifications_dict.values())
+    split_offsets = np.cumsum([len(measurements) for measurements in floor_measurements])[:-1]
+    category_masks = pr_utils.assign_tp_fp_fn_tn(
+        np.concatenate([measurements.y_true for measurements in floor_measurements]),
+        y_pred=np.concatenate([measurements.y_hat for measurements in floor_measurements]),
+    )
+    floor_category_masks = zip(*[np.split(mask, split_offsets) for mask in category_masks])
 
     # loop over each building and floor
-    for (building_id, floor_id), measurements in floor_edgeclassifications_dict.items():
+    for ((building_id, floor_id), measurements), (is_TP, is_FP, is_FN, is_TN) in zip(
+        floor_edgeclassifications_dict.items(), floor_category_masks
+    ):
 
         # if building_id != '1490': # '1394':# '1635':
         # 	continue
@@ -33,33 +48,18 @@ def vis_edge_classifications(serialized_preds_json_dir: str, raw_dataset_dir: st
         print(f"On building {building_id}, {floor_id}")
         gt_floor_pose_graph = posegraph2d.get_gt_pose_graph(building_id, floor_id, raw_dataset_dir)
 
-        # Gather all of the edge classifications.
-        y_hat = np.array([m.y_hat for m in measurements])
-        y_true = np.array([m.y_true for m in measurements])
-
-        # Classify into TPs, FPs, FNs, TNs
-        is_TP, is_FP, is_FN, is_TN = pr_utils.assign_tp_fp_fn_tn(y_true, y_pred=y_hat)
-        for m, is_tp, is_fp, is_fn, is_tn in zip(measurements, is_TP, is_FP, is_FN, is_TN):
-
-            # Then, render the edges.
-            if is_tp:
-                color = color_dict["TP"]
-                # gt_floor_pose_graph.draw_edge(m.i1, m.i2, color)
-                print(f"\tFP: ({m.i1},{m.i2}) for pair {m.pair_idx}")
-
-            elif is_fp:
-                color = color_dict["FP"]
-
-            elif is_fn:
-                color = color_dict["FN"]
-                # gt_floor_pose_graph.draw_edge(m.i1, m.i2, color)
+        # Render the edges of each category, one straight-line loop per category.
+        for i1, i2, pair_idx in zip(
+            measurements.i1[is_TP].tolist(), measurements.i2[is_TP].tolist(), measurements.pair_idx[is_TP].tolist()
+        ):
+            # gt_floor_pose_graph.draw_edge(i1, i2, color_dict["TP"])
+            print(f"\tFP: ({i1},{i2}) for pair {pair_idx}")
 
-            elif is_tn:
-                color = color_dict["TN"]
-                gt_floor_pose_graph.draw_edge(m.i1, m.i2, color)
+        # for i1, i2 in zip(measurements.i1[is_FN].tolist(), measurements.i2[is_FN].tolist()):
+        #     gt_floor_pose_graph.draw_edge(i1, i2, color_dict["FN"])
 
-            # if m.i1 or m.i2 not in gt_floor_pose_graph.nodes:
-            # 	import pdb; pdb.set_trace()
+        for i1, i2 in zip(measurements.i1[is_TN].tolist(), measurements.i2[is_TN].tolist()):
+            gt_floor_pose_graph.draw_edge(i1, i2, tn_color)
 
         # render the pose graph first
         gt_floor_pose_graph.render_estimated_layout(show_plot=True)
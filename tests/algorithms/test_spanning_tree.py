@@ -107,13 +107,12 @@ def _create_synthetic_relative_pose_measurements(
     Returns:
         i2Ri1_dict: Relative rotation measurements.
     """
-    i2Ri1_dict = {}
-    for (i1, i2) in edges:
-        wRi2 = wRi_list_gt[i2]
-        wRi1 = wRi_list_gt[i1]
-        i2Ri1_dict[(i1, i2)] = wRi2.T @ wRi1
+    wRi_arr = np.stack(wRi_list_gt)
+    edges_arr = np.array(edges)
+    # Compute i2Ri1 = wRi2^T @ wRi1 for all edges at once.
+    i2Ri1_arr = np.einsum("nji,njk->nik", wRi_arr[edges_arr[:, 1]], wRi_arr[edges_arr[:, 0]])
 
-    return i2Ri1_dict
+    return {(i1, i2): i2Ri1 for (i1, i2), i2Ri1 in zip(edges, i2Ri1_arr)}
 
 
 def test_greedily_construct_st_ordered_chain() -> None:
@@ -163,6 +162,17 @@ def test_globalaveraging2d_ordered_chain() -> None:
     assert np.allclose(wRi_list_shonan_est_wrapped, wRi_list_shonan_expected, atol=0.01)
 
 
+def test_estimate_global_rotations_with_rotation_averaging() -> None:
+    """Ensures that rotation averaging and the greedy spanning tree agree on a chain, in the same gauge."""
+    i2Ri1_dict, wRi_list_euler_deg_expected = _get_ordered_chain_pose_data()
+
+    wRi_list_greedy = spanning_tree.estimate_global_rotations(i2Ri1_dict, use_rotation_averaging=False)
+    wRi_list_averaged = spanning_tree.estimate_global_rotations(i2Ri1_dict, use_rotation_averaging=True)
+    assert len(wRi_list_averaged) == len(wRi_list_greedy)
+    for wRi_greedy, wRi_averaged in zip(wRi_list_greedy, wRi_list_averaged):
+        assert np.allclose(wRi_greedy, wRi_averaged, atol=1e-4)
+
+
 def test_greedily_construct_st_mixed_order_chain() -> None:
     """Ensures that we can greedily construct a Spanning Tree for an ordered chain."""
     i2Ri1_dict, wRi_list_euler_deg_expected = _get_mixed_order_chain_pose_data()
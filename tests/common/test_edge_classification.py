@@ -0,0 +1,64 @@
+"""Unit tests for conversion of serialized model predictions into edge classifications."""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import salve.common.edge_classification as edge_classification
+import salve.utils.io as io_utils
+
+
+def test_get_edge_classification_arrays_from_serialized_preds(tmp_path: Path) -> None:
+    """Ensure that predictions from batches mixed across floors are regrouped into per-floor arrays."""
+    batch_0 = {
+        "y_hat": [1, 0],
+        "y_true": [1, 1],
+        "y_hat_probs": [0.9, 0.6],
+        "fp0": [
+            "0715/pair_12___door_3_0_identity_floor_rgb_floor_01_partial_room_02_pano_38.jpg",
+            "0715/pair_7___window_0_1_rotated_floor_rgb_floor_02_partial_room_01_pano_5.jpg",
+        ],
+        "fp1": [
+            "0715/pair_12___door_3_0_identity_floor_rgb_floor_01_partial_room_03_pano_4.jpg",
+            "0715/pair_7___window_0_1_rotated_floor_rgb_floor_02_partial_room_04_pano_9.jpg",
+        ],
+    }
+    batch_1 = {
+        "y_hat": [0],
+        "y_true": [0],
+        "y_hat_probs": [0.8],
+        "fp0": ["0715/pair_13___opening_0_0_identity_floor_rgb_floor_01_partial_room_02_pano_38.jpg"],
+        "fp1": ["0715/pair_13___opening_0_0_identity_floor_rgb_floor_01_partial_room_05_pano_40.jpg"],
+    }
+    io_utils.save_json_file(str(tmp_path / "batch_0.json"), batch_0)
+    io_utils.save_json_file(str(tmp_path / "batch_1.json"), batch_1)
+
+    arrays_dict = edge_classification.get_edge_classification_arrays_from_serialized_preds(str(tmp_path))
+    assert set(arrays_dict.keys()) == {("0715", "floor_01"), ("0715", "floor_02")}
+
+    floor_01 = arrays_dict[("0715", "floor_01")]
+    order = np.argsort(floor_01.pair_idx)
+    assert len(floor_01) == 2
+    assert floor_01.y_hat.dtype == np.int8
+    # Pano IDs should be sorted within each pair, i.e. i1 < i2.
+    np.testing.assert_array_equal(floor_01.i1[order], [4, 38])
+    np.testing.assert_array_equal(floor_01.i2[order], [38, 40])
+    np.testing.assert_array_equal(floor_01.pair_idx[order], [12, 13])
+    np.testing.assert_array_equal(floor_01.y_hat[order], [1, 0])
+    np.testing.assert_array_equal(floor_01.y_true[order], [1, 0])
+    np.testing.assert_allclose(floor_01.prob[order], [0.9, 0.8])
+
+    floor_02 = arrays_dict[("0715", "floor_02")]
+    np.testing.assert_array_equal(floor_02.i1, [5])
+    np.testing.assert_array_equal(floor_02.i2, [9])
+    np.testing.assert_array_equal(floor_02.y_hat, [0])
+
+
+def test_get_edge_classification_arrays_from_serialized_preds_malformed_fpath(tmp_path: Path) -> None:
+    """Ensure that an image file name that does not encode an alignment hypothesis is rejected."""
+    batch = {"y_hat": [1], "y_true": [1], "y_hat_probs": [0.9], "fp0": ["0715/pano_38.jpg"], "fp1": ["0715/pano_4.jpg"]}
+    io_utils.save_json_file(str(tmp_path / "batch_0.json"), batch)
+
+    with pytest.raises(ValueError):
+        edge_classification.get_edge_classification_arrays_from_serialized_preds(str(tmp_path))
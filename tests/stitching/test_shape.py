@@ -0,0 +1,61 @@
+"""Unit tests for room shape generation and refinement utilities used for floorplan stitching."""
+
+import math
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+import salve.stitching.shape as shape_utils
+
+
+def test_generate_dense_shapes() -> None:
+    """Ensures that batched dense shape generation matches projecting each pano's sampled floor boundary."""
+    rng = np.random.default_rng(0)
+    num_panos = 3
+    # Floor boundaries lie below the horizon (image row 256).
+    v_vals = rng.uniform(300, 500, size=(num_panos, shape_utils.IMAGE_WIDTH_PX))
+    uncertainty = rng.uniform(0, 20, size=(num_panos, shape_utils.IMAGE_WIDTH_PX))
+
+    dense_shapes = shape_utils.generate_dense_shapes(v_vals=v_vals, uncertainty=uncertainty)
+    assert len(dense_shapes) == num_panos
+
+    us = np.arange(shape_utils.IMAGE_WIDTH_PX) / shape_utils.IMAGE_WIDTH_PX
+    for i, (polygon, distances) in enumerate(dense_shapes):
+        uvs = [[us[j], v_vals[i, j] / shape_utils.IMAGE_HEIGHT_PX] for j in range(shape_utils.IMAGE_WIDTH_PX)]
+        expected_polygon, expected_polygon_upper = shape_utils.load_room_shape_polygon_from_predictions(
+            uvs, list(uncertainty[i])
+        )
+        assert np.allclose(polygon.exterior.coords, expected_polygon.exterior.coords)
+
+        xys = expected_polygon.boundary.xy
+        xys_upper = expected_polygon_upper.boundary.xy
+        expected_distances = [
+            math.sqrt((xys_upper[0][j] - xys[0][j]) ** 2 + (xys_upper[1][j] - xys[1][j]) ** 2)
+            for j in range(len(xys[0]))
+        ]
+        assert np.allclose(distances, expected_distances)
+
+    # The single-pano version should agree with the batched version.
+    polygon, distances = shape_utils.generate_dense_shape(v_vals=list(v_vals[0]), uncertainty=list(uncertainty[0]))
+    assert np.allclose(polygon.exterior.coords, dense_shapes[0][0].exterior.coords)
+    assert np.allclose(distances, dense_shapes[0][1])
+
+
+def test_subdivide_polygon() -> None:
+    """Ensures that a polygon with many vertices is split into small tiles that exactly cover it."""
+    angles = np.linspace(0, 2 * np.pi, 1000, endpoint=False)
+    radii = 2 + 0.5 * np.sin(7 * angles)
+    polygon = Polygon(np.stack([radii * np.cos(angles), radii * np.sin(angles)], axis=1))
+    query_polygon = Polygon([(0, 0), (3, 0), (3, 3), (0, 3)])
+
+    tiles = shape_utils.subdivide_polygon(polygon, max_vertices=64)
+    assert len(tiles) > 1
+    assert all(shapely.get_num_coordinates(tile) <= 64 for tile in tiles)
+    assert math.isclose(sum(tile.area for tile in tiles), polygon.area)
+    assert math.isclose(
+        sum(tile.intersection(query_polygon).area for tile in tiles), polygon.intersection(query_polygon).area
+    )
+
+    # Simple polygons are not split.
+    assert shape_utils.subdivide_polygon(query_polygon, max_vertices=64) == [query_polygon]
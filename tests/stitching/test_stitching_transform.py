@@ -0,0 +1,32 @@
+"""Unit tests for coordinate transformation utilities used for floorplan stitching."""
+
+import numpy as np
+
+import salve.stitching.transform as transform_utils
+from salve.stitching.models.locations import Point2d, Pose
+
+
+def test_vectorized_transforms_match_scalar_transforms() -> None:
+    """Ensures that the array-based pose transforms and uv conversions match their per-point counterparts."""
+    rng = np.random.default_rng(0)
+    xys = rng.uniform(-3, 3, size=(20, 2))
+    pose = Pose(position=Point2d(x=0.7, y=-1.2), rotation=37.0)
+    height = 1.5
+
+    transformed = transform_utils.transform_xys_by_pose(xys, pose)
+    projected = transform_utils.project_xys_by_pose(xys, pose)
+    uvs = transform_utils.xys_to_uvs(xys, height)
+    xs, ys = transform_utils.uvs_to_xys(uvs[:, 0], uvs[:, 1], height)
+    for i, (x, y) in enumerate(xys):
+        xy = Point2d(x=x, y=y)
+        expected_transformed = transform_utils.transform_xy_by_pose(xy, pose)
+        assert np.allclose(transformed[i], [expected_transformed.x, expected_transformed.y])
+
+        expected_projected = transform_utils.project_xy_by_pose(xy, pose)
+        assert np.allclose(projected[i], [expected_projected.x, expected_projected.y])
+
+        expected_uv = transform_utils.xy_to_uv(xy, height)
+        assert np.allclose(uvs[i], [expected_uv.x, expected_uv.y])
+
+    # Projecting back to the ground plane recovers the original points.
+    assert np.allclose(np.stack([xs, ys], axis=1), xys)
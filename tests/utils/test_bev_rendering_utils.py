@@ -1,8 +1,16 @@
 """Unit tests for bird's eye view texture map rendering utilities."""
 
+import tempfile
+from types import SimpleNamespace
+
+import cv2
+import imageio.v2 as imageio
 import numpy as np
+import pytest
 
 import salve.utils.bev_rendering_utils as bev_rendering_utils
+from salve.common.bevparams import BEVParams
+from salve.common.sim2 import Sim2
 
 
 def test_prune_to_2d_bbox() -> None:
@@ -38,3 +46,149 @@ def test_prune_to_2d_bbox() -> None:
 
     assert np.allclose(valid_pts, expected_valid_pts)
     assert np.allclose(valid_rgb, expected_valid_rgb)
+
+
+def test_rasterize_single_layout() -> None:
+    """Ensures that a square room layout is rasterized as a filled, centered mask at the default BEV resolution."""
+    bev_params = BEVParams()
+    # 1 meter x 1 meter square room, centered at the panorama location.
+    room_vertices = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5], [-0.5, -0.5]])
+
+    bev_img = bev_rendering_utils.rasterize_single_layout(bev_params, room_vertices, wdo_objs=[])
+    assert bev_img.shape == (bev_params.img_h + 1, bev_params.img_w + 1, 3)
+    assert bev_img.dtype == np.uint8
+
+    # Center pixel falls inside the room, and image corners fall outside of it.
+    assert np.all(bev_img[bev_params.img_h // 2, bev_params.img_w // 2] == 255)
+    assert np.all(bev_img[0, 0] == 0)
+
+    # Rendering again (with constants served from the cache) must yield an identical image.
+    assert np.array_equal(bev_img, bev_rendering_utils.rasterize_single_layout(bev_params, room_vertices, wdo_objs=[]))
+
+
+def test_get_rendering_fpaths_for_pair() -> None:
+    """Ensures that BEV rendering file paths are derived from the pair's file name and the panorama file names."""
+    img_fpaths_dict = {
+        5: "ZInD/1208/panos/floor_01_partial_room_04_pano_5.jpg",
+        8: "ZInD/1208/panos/floor_01_partial_room_07_pano_8.jpg",
+    }
+    pair_fpath = "hypotheses/1208/floor_01/gt_alignment_approx/5_8__door_0_0_rotated.json"
+
+    fpath1, fpath2 = bev_rendering_utils.get_rendering_fpaths_for_pair(
+        img_fpaths_dict=img_fpaths_dict,
+        surface_type="ceiling",
+        pair_fpath=pair_fpath,
+        pair_idx=58,
+        label_type="gt_alignment_approx",
+        save_root="Renderings",
+        building_id="1208",
+    )
+    assert fpath1 == (
+        "Renderings/gt_alignment_approx/1208/"
+        "pair_58___door_0_0_rotated_ceiling_rgb_floor_01_partial_room_04_pano_5.jpg"
+    )
+    assert fpath2 == (
+        "Renderings/gt_alignment_approx/1208/"
+        "pair_58___door_0_0_rotated_ceiling_rgb_floor_01_partial_room_07_pano_8.jpg"
+    )
+
+
+def test_write_rgb_image_pair() -> None:
+    """Ensures that RGB images written with OpenCV are read back with the same (RGB) channel order."""
+    img1 = np.zeros((100, 100, 3), dtype=np.uint8)
+    img1[:, :, 0] = 255  # red
+    img2 = np.zeros((100, 100, 3), dtype=np.uint8)
+    img2[:, :, 2] = 255  # blue
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fpath1 = f"{tmp_dir}/img1.jpg"
+        fpath2 = f"{tmp_dir}/img2.jpg"
+        bev_rendering_utils.write_rgb_image_pair(fpath1, img1, fpath2, img2)
+
+        assert np.allclose(imageio.imread(fpath1), img1, atol=5)
+        assert np.allclose(imageio.imread(fpath2), img2, atol=5)
+
+        # Renderings must be quantized to uint8 before encoding.
+        with pytest.raises(ValueError):
+            bev_rendering_utils.write_rgb_image(f"{tmp_dir}/img3.jpg", img1.astype(np.float32))
+
+
+def test_background_image_writer() -> None:
+    """Ensures that all queued images are written on exit, and that a failed write is re-raised."""
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    img[:, :, 1] = 255  # green
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fpaths = [f"{tmp_dir}/img{k}.jpg" for k in range(20)]
+        with bev_rendering_utils.BackgroundImageWriter(max_queue_size=2) as image_writer:
+            for fpath in fpaths:
+                image_writer.write(fpath, img)
+
+        for fpath in fpaths:
+            assert np.allclose(imageio.imread(fpath), img, atol=5)
+
+        with pytest.raises(RuntimeError):
+            with bev_rendering_utils.BackgroundImageWriter() as image_writer:
+                image_writer.write(f"{tmp_dir}/nonexistent_dir/img.jpg", img)
+
+
+def test_read_images() -> None:
+    """Ensures that images are decoded and keyed by file path, and that missing files are skipped."""
+    depth = np.random.randint(low=0, high=5000, size=(64, 128), dtype=np.uint16)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        depth_fpath = f"{tmp_dir}/pano_1.depth.png"
+        imageio.imwrite(depth_fpath, depth)
+        images = bev_rendering_utils.read_images([depth_fpath, f"{tmp_dir}/pano_2.depth.png"])
+
+    assert list(images.keys()) == [depth_fpath]
+    assert np.array_equal(images[depth_fpath], depth)
+
+
+def test_get_z_crop_mask() -> None:
+    """Ensures that one-sided (infinite) z-ranges match the two-sided comparison, and that NaN values are excluded."""
+    z = np.array([-2.0, -1.0, -0.5, 0.5, 0.6, np.nan])
+    for crop_z_range in [[-float("inf"), -1.0], [0.5, float("inf")], [-1.0, 0.5], [-float("inf"), float("inf")]]:
+        mask = bev_rendering_utils.get_z_crop_mask(z, crop_z_range)
+        expected_mask = np.logical_and(z > crop_z_range[0], z <= crop_z_range[1])
+        assert np.array_equal(mask, expected_mask)
+
+
+def test_render_bev_pair_for_z_ranges() -> None:
+    """Ensures that rendering floor and ceiling from a single backprojection matches rendering each one separately."""
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        args = SimpleNamespace(scale=0.001, crop_ratio=80 / 512)
+        for k in [1, 2]:
+            setattr(args, f"img_i{k}", f"{tmp_dir}/pano_{k}.png")
+            setattr(args, f"depth_i{k}", f"{tmp_dir}/pano_{k}.depth.png")
+            imageio.imwrite(args.__dict__[f"img_i{k}"], rng.integers(0, 256, size=(512, 1024, 3), dtype=np.uint8))
+            imageio.imwrite(args.__dict__[f"depth_i{k}"], rng.integers(1000, 3000, size=(512, 1024), dtype=np.uint16))
+
+        i2Ti1 = Sim2(R=np.eye(2), t=np.array([0.5, -0.5]), s=1.0)
+        crop_z_ranges = [bev_rendering_utils.SURFACE_CROP_Z_RANGES[surface] for surface in ["floor", "ceiling"]]
+        bev_img_pairs = bev_rendering_utils.render_bev_pair_for_z_ranges(
+            args, "0000", "floor_01", 1, 2, i2Ti1, is_semantics=False, crop_z_ranges=crop_z_ranges
+        )
+        for crop_z_range, (bev_img1, bev_img2) in zip(crop_z_ranges, bev_img_pairs):
+            args.crop_z_range = crop_z_range
+            expected_bev_img1, expected_bev_img2 = bev_rendering_utils.render_bev_pair(
+                args, "0000", "floor_01", 1, 2, i2Ti1, is_semantics=False
+            )
+            assert bev_img1.dtype == np.uint8
+            assert np.array_equal(bev_img1, expected_bev_img1)
+            assert np.array_equal(bev_img2, expected_bev_img2)
+
+
+def test_get_resize_interpolation() -> None:
+    """Ensures that area interpolation is used for downsampling, and matches bilinear at a 2x downsampling factor."""
+    rgb = np.random.randint(low=0, high=256, size=(1024, 2048, 3), dtype=np.uint8)
+    interpolation = bev_rendering_utils.get_resize_interpolation(rgb, h=512, w=1024, is_semantics=False)
+    assert interpolation == cv2.INTER_AREA
+    assert np.array_equal(
+        cv2.resize(rgb, (1024, 512), interpolation=interpolation),
+        cv2.resize(rgb, (1024, 512), interpolation=cv2.INTER_LINEAR),
+    )
+
+    assert bev_rendering_utils.get_resize_interpolation(rgb, h=512, w=1024, is_semantics=True) == cv2.INTER_NEAREST
+    assert bev_rendering_utils.get_resize_interpolation(rgb, h=2048, w=4096, is_semantics=False) == cv2.INTER_LINEAR
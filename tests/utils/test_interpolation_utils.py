@@ -82,6 +82,35 @@ def test_interp_dense_grid_from_sparse() -> None:
     # plt.show()
 
 
+def test_interp_dense_grid_from_sparse_allocates_output() -> None:
+    """Ensure that when no output grid is provided, one is allocated and matches a provided (preallocated) grid."""
+    RED = [255, 0, 0]
+    GREEN = [0, 255, 0]
+    BLUE = [0, 0, 255]
+
+    points = np.array([[0, 0], [0, 3], [3, 3], [3, 0]])
+    rgb_values = np.array([RED, GREEN, BLUE, RED])
+
+    dense_grid = interpolation_utils.interp_dense_grid_from_sparse(
+        None, points, rgb_values, grid_h=4, grid_w=4, is_semantics=False
+    )
+    expected_dense_grid = interpolation_utils.interp_dense_grid_from_sparse(
+        np.zeros((4, 4, 3), dtype=np.uint8), points, rgb_values, grid_h=4, grid_w=4, is_semantics=False
+    )
+    assert dense_grid.dtype == np.uint8
+    assert np.array_equal(dense_grid, expected_dense_grid)
+
+    # Corners of the grid coincide with the sparse samples.
+    assert np.array_equal(dense_grid[0, 0], RED)
+    assert np.array_equal(dense_grid[3, 3], BLUE)
+
+    # When interpolation is impossible, an all-zero grid should be returned.
+    empty_grid = interpolation_utils.interp_dense_grid_from_sparse(
+        None, points[:2], rgb_values[:2], grid_h=4, grid_w=4, is_semantics=False
+    )
+    assert np.array_equal(empty_grid, np.zeros((4, 4, 3), dtype=np.uint8))
+
+
 def test_remove_hallucinated_content() -> None:
     """ """
     sparse_bev_img = np.array(
@@ -146,5 +175,6 @@ if __name__ == "__main__":
     test_interp_dense_grid_from_sparse_collinear()
     test_interp_dense_grid_from_sparse_insufficient_points_simplex()
     test_interp_dense_grid_from_sparse()
+    test_interp_dense_grid_from_sparse_allocates_output()
     # test_remove_hallucinated_content() # Can cause segfault.
     # test_remove_hallucinated_content_largekernel() # Can cause segfault.
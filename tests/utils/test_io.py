@@ -0,0 +1,21 @@
+"""Unit tests for file I/O utilities."""
+
+from pathlib import Path
+
+import pytest
+
+import salve.utils.io as io_utils
+
+
+def test_save_and_read_json_file(tmp_path: Path) -> None:
+    """Ensures that a nested dictionary survives a round trip through a JSON file."""
+    data = {"panos": {"065cd4e4e0": {"pose": {"x": 1.5, "y": -2.0, "rotation": 90}}}, "floor_id": "floor_01"}
+    json_fpath = str(tmp_path / "subdir" / "data.json")
+    io_utils.save_json_file(json_fpath=json_fpath, data=data)
+    assert io_utils.read_json_file(json_fpath) == data
+
+
+def test_read_json_file_missing(tmp_path: Path) -> None:
+    """Ensures that reading a nonexistent JSON file raises an informative error."""
+    with pytest.raises(FileNotFoundError, match="No file found at"):
+        io_utils.read_json_file(tmp_path / "missing.json")